@@ -0,0 +1,225 @@
+"""
+An ACL authorization policy backed by a per-node index of effective ACEs.
+
+``IndexedACLAuthorizationPolicy`` is a drop-in replacement for Pyramid's
+``ACLAuthorizationPolicy``.  The stock policy walks the ``__parent__`` chain
+of the context and scans every ``__acl__`` it finds on every check, so the
+cost of a check grows with the depth of the tree and the length of the ACLs.
+
+This policy instead computes, once per (node, permission), a dictionary
+mapping each principal to the first ACE in the node's lineage that mentions
+that principal and grants or denies that permission.  The dictionary is
+built from the parent's one, so it costs one ACL scan per node, and a check
+then only looks up the request's principals in it, however deep the node is.
+
+The index is keyed weakly on the resource objects themselves.  If you change
+an ``__acl__`` on a resource that is already indexed, tell the policy::
+
+    root['1'].set_acl([(Deny, Everyone, 'delete')])
+    authz_policy.invalidate(root['1'])
+
+which drops the index of that resource and of every resource whose index was
+built from it, and nothing else.  An index being built while ACLs are
+invalidated is thrown away after its check, since it may have been built
+from the old ones.  Alternatively, pass ``acl_version``, a function
+returning a number that changes whenever any ACL in the tree changes (app7's
+``Resource.set_acl`` counts its calls in ``app7.acl_version``)::
+
+    authz_policy = IndexedACLAuthorizationPolicy(
+        acl_version=lambda: app7.acl_version)
+
+and everything indexed is dropped when it changes, with nobody having to
+remember to call ``invalidate``.
+
+A callable ``__acl__`` may answer differently on every call, so it is not
+indexed: a check on a resource that has one, or that has an ancestor with
+one, is made the stock way.
+"""
+import threading
+import weakref
+
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.compat import is_nonstr_iter, string_types
+from pyramid.security import ACLAllowed, ACLDenied, Allow
+
+_NO_ACL = '<No ACL found on any object in resource lineage>'
+
+class _NodeIndex(object):
+    def __init__(self, node, parent):
+        self.stale = False
+        self.dependents = weakref.WeakSet()
+        self.permissions = {}
+        try:
+            acl = node.__acl__
+        except AttributeError:
+            acl = None
+        self.acl = acl
+        self.parent = parent
+        # a callable __acl__ is called by the stock policy on every check
+        self.dynamic = callable(acl) or (
+            parent is not None and parent.dynamic)
+        # the stock policy reports the ACL nearest the root on default deny
+        self.top_acl = _NO_ACL if acl is None else acl
+        if parent is None:
+            self.depth = 0
+        else:
+            self.depth = parent.depth + 1
+            if parent.top_acl is not _NO_ACL:
+                self.top_acl = parent.top_acl
+            parent.dependents.add(self)
+
+    def entries(self, node, permission):
+        """ Return the principal -> (rank, ace, acl, location) map for
+        ``permission`` at ``node``, building it (and any missing ancestor
+        maps) if necessary.  Smaller ranks are found first by the stock
+        policy's walk."""
+        entries = self.permissions.get(permission)
+        if entries is not None:
+            return entries
+        pending = []
+        index = self
+        while index is not None and permission not in index.permissions:
+            pending.append((index, node))
+            index = index.parent
+            node = node.__parent__
+        entries = {} if index is None else index.permissions[permission]
+        for index, node in reversed(pending):
+            own = {}
+            for position, ace in enumerate(index.acl or ()):
+                ace_action, ace_principal, ace_permissions = ace
+                if ace_principal in own:
+                    continue
+                if not is_nonstr_iter(ace_permissions):
+                    ace_permissions = [ace_permissions]
+                if permission in ace_permissions:
+                    own[ace_principal] = (
+                        (-index.depth, position), ace, index.acl, node)
+            if own:
+                entries = dict(entries)
+                entries.update(own)
+            index.permissions[permission] = entries
+        return entries
+
+class IndexedACLAuthorizationPolicy(ACLAuthorizationPolicy):
+    """ An ``ACLAuthorizationPolicy`` that answers ``permits`` from a
+    precomputed index of effective ACEs.  Resources it can not weakly
+    reference, and those with a callable ``__acl__`` in their lineage, are
+    checked the stock way."""
+    def __init__(self, acl_version=None):
+        self._indexes = weakref.WeakKeyDictionary()
+        self.acl_version = acl_version
+        self.indexed_version = None if acl_version is None else acl_version()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def _index(self, context):
+        if self.acl_version is not None:
+            version = self.acl_version()
+            if version != self.indexed_version:
+                self.invalidate_all()
+                self.indexed_version = version
+        index = self._indexes.get(context)
+        if index is not None and not index.stale:
+            return index
+        # read before any ACL, see the end
+        generation = self.generation
+        lineage = []
+        node = context
+        while node is not None:
+            index = self._indexes.get(node)
+            if index is not None and not index.stale:
+                break
+            lineage.append(node)
+            node = node.__parent__
+        built = []
+        for node in reversed(lineage):
+            index = _NodeIndex(node, index)
+            self._indexes[node] = index
+            built.append(index)
+        if self.generation != generation:
+            # something was invalidated meanwhile, maybe after we read its
+            # old ACL, or after we attached a new index to one it was
+            # marking stale; keep these for this check only
+            for stale in built:
+                stale.stale = True
+        return index
+
+    def permits(self, context, principals, permission):
+        try:
+            index = self._index(context)
+        except TypeError: # not weakly referenceable
+            index = None
+        if index is None or index.dynamic:
+            return ACLAuthorizationPolicy.permits(
+                self, context, principals, permission)
+        entries = index.entries(context, permission)
+        found = None
+        for principal in principals:
+            entry = entries.get(principal)
+            if entry is not None and (found is None or entry[0] < found[0]):
+                found = entry
+        if found is None:
+            return ACLDenied(
+                '<default deny>', index.top_acl, permission, principals,
+                context)
+        rank, ace, acl, location = found
+        if ace[0] == Allow:
+            return ACLAllowed(ace, acl, permission, principals, location)
+        return ACLDenied(ace, acl, permission, principals, location)
+
+    def permits_many(self, root, principals, permission, paths):
+        """ Return a list of booleans, one per path in ``paths``, saying
+        whether ``principals`` have ``permission`` on the resource that
+        traversal from ``root`` would find for that path.  A path is a
+        string like ``'/1'`` or a sequence of names.  As with
+        ``add_route(traverse=...)``, traversal stops at the deepest existing
+        resource.  Resources shared between paths (the container of a page
+        of blog entries, say) are traversed to and indexed once."""
+        principals = frozenset(principals)
+        found = {(): root}
+        decisions = {}
+        results = []
+        for path in paths:
+            if isinstance(path, string_types):
+                path = path.split('/')
+            path = tuple(name for name in path if name)
+            node = found.get(path)
+            if node is None:
+                depth = len(path)
+                while path[:depth] not in found:
+                    depth -= 1
+                node = found[path[:depth]]
+                for name in path[depth:]:
+                    try:
+                        node = node[name]
+                    except KeyError:
+                        break
+                    depth += 1
+                    found[path[:depth]] = node
+                found[path] = node
+            decision = decisions.get(id(node))
+            if decision is None:
+                decision = decisions[id(node)] = bool(
+                    self.permits(node, principals, permission))
+            results.append(decision)
+        return results
+
+    def invalidate(self, resource):
+        """ Forget what is indexed about ``resource`` and its descendants,
+        e.g. after its ``__acl__`` has changed."""
+        with self.lock:
+            # first, so that indexes being built now are thrown away
+            self.generation += 1
+            index = self._indexes.pop(resource, None)
+            stack = [] if index is None else [index]
+            while stack:
+                index = stack.pop()
+                index.stale = True
+                stack.extend(index.dependents)
+                index.dependents = weakref.WeakSet()
+
+    def invalidate_all(self):
+        """ Forget everything indexed."""
+        with self.lock:
+            self.generation += 1
+            self._indexes = weakref.WeakKeyDictionary()
@@ -86,6 +86,7 @@ if __name__ == '__main__':
     config.add_route('blogentry_delete', '/blog/{id}/delete')
     config.add_route('login', '/login')
     config.add_route('logout', '/logout')
+    config.include('lazycookies')
     config.scan()
     app = config.make_wsgi_app()
     serve(app, threads=1)
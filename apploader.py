@@ -0,0 +1,30 @@
+"""
+Load the WSGI application that one of the app*.py scripts would serve.
+
+Each script builds its application in an ``if __name__ == '__main__':``
+block and hands it to ``waitress.serve``.  ``load_app`` runs the script as
+``__main__`` with ``waitress.serve`` swapped for a function that captures
+the application instead of serving it, so launchers and benchmarks can use
+exactly the configuration the script would::
+
+    app = load_app('app7.py')
+"""
+import runpy
+
+import waitress
+
+def load_app(filename):
+    """ Run ``filename`` as ``__main__`` and return the WSGI application it
+    passed to ``waitress.serve``."""
+    captured = []
+    def serve(app, **kw):
+        captured.append(app)
+    original = waitress.serve
+    waitress.serve = serve
+    try:
+        runpy.run_path(filename, run_name='__main__')
+    finally:
+        waitress.serve = original
+    if not captured:
+        raise ValueError('%s did not call waitress.serve' % filename)
+    return captured[0]
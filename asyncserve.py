@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Serve one of the app*.py applications from asyncio instead of waitress.
+
+waitress gives each connection a worker thread for as long as it takes to
+read the request and write the response, so a handful of slow clients can
+occupy every thread.  Here the connections are handled by an asyncio event
+loop, and a thread from a bounded pool is only used to run the application
+(including its authentication and authorization policies, which block) once
+a request has been read completely::
+
+    python3 asyncserve.py app7.py --port 6543 --threads 4
+
+The same application can be served by any ASGI server through
+``ASGIApplication``::
+
+    app = ASGIApplication(load_app('app7.py'), threads=4)
+
+This module needs Python 3.  ``loadtest`` is the client used by
+``python bench.py latency`` to compare it with waitress.
+"""
+import argparse
+import asyncio
+import io
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes
+
+from apploader import load_app
+
+def call_wsgi(app, environ):
+    """ Call a WSGI ``app`` and return its status, headers and body."""
+    started = []
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+    result = app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = started
+    return status, headers, body
+
+def wsgi_path(path):
+    """ Percent-decode a request path (``str`` or ``bytes``) into a WSGI
+    ``PATH_INFO``: the path's bytes as a latin-1 ``str``."""
+    return unquote_to_bytes(path).decode('latin-1')
+
+def error_response(status):
+    body = status.encode('latin-1')
+    return status, [('Content-Type', 'text/plain')], body
+
+def make_environ(method, path, query, version, headers, body, server,
+                 client):
+    """ ``path`` is already a WSGI ``PATH_INFO`` (see ``wsgi_path``)."""
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        }
+    for name, value in headers:
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+class Server(object):
+    """ An HTTP/1.1 server (keep-alive, Content-Length bodies only) that
+    runs ``app`` in a pool of ``threads`` threads.  A malformed request
+    gets a 400, a ``Transfer-Encoding`` a 501 (a 400 with a
+    ``Content-Length``), a version other than HTTP/1.0 and 1.1 a 505, a body
+    longer than ``max_body_size`` a 413 and an exception from ``app`` a 500,
+    and the connection is closed."""
+    max_header_size = 65536
+    max_body_size = 10 * 1024 * 1024
+
+    def __init__(self, app, threads=4, backlog=1024):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.backlog = backlog
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        server = writer.get_extra_info('sockname')[:2]
+        client = writer.get_extra_info('peername')[:2]
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    lines = head.decode('latin-1').split('\r\n')
+                    method, target, version = lines[0].split(' ', 2)
+                    headers = [line.split(':', 1) for line in lines[1:]
+                               if line]
+                    headers = [(name.strip(), value.strip())
+                               for name, value in headers]
+                    length = None
+                    for name, value in headers:
+                        if name.lower() == 'content-length':
+                            if length is not None:
+                                raise ValueError('two Content-Lengths')
+                            length = int(value)
+                            if length < 0:
+                                raise ValueError(length)
+                except ValueError:
+                    # a malformed request line, header or Content-Length
+                    self.respond(writer, 'HTTP/1.1',
+                                 *error_response('400 Bad Request'))
+                    break
+                if version not in ('HTTP/1.0', 'HTTP/1.1'):
+                    self.respond(writer, 'HTTP/1.1', *error_response(
+                        '505 HTTP Version Not Supported'))
+                    break
+                fields = dict((name.lower(), value)
+                              for name, value in headers)
+                if 'transfer-encoding' in fields:
+                    # chunked bodies are not decoded; reading on as if there
+                    # were no body would take the chunks for the next request
+                    if length is not None:
+                        status = '400 Bad Request'
+                    else:
+                        status = '501 Not Implemented'
+                    self.respond(writer, version, *error_response(status))
+                    break
+                length = length or 0
+                if length > self.max_body_size:
+                    self.respond(
+                        writer, version,
+                        *error_response('413 Request Entity Too Large'))
+                    break
+                body = b''
+                if length:
+                    try:
+                        body = await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+                path, _, query = target.partition('?')
+                environ = make_environ(method, wsgi_path(path), query,
+                                       version, headers, body, server,
+                                       client)
+                keep_alive = (version == 'HTTP/1.1' and
+                              fields.get('connection', '').lower() != 'close')
+                try:
+                    status, response_headers, body = (
+                        await loop.run_in_executor(
+                            self.executor, call_wsgi, self.app, environ))
+                except Exception:
+                    traceback.print_exc()
+                    status, response_headers, body = error_response(
+                        '500 Internal Server Error')
+                    keep_alive = False
+                self.respond(writer, version, status, response_headers, body,
+                             keep_alive, head=method == 'HEAD')
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    def respond(self, writer, version, status, headers, body,
+                keep_alive=False, head=False):
+        """ Write a response; for a HEAD request (``head``), the headers
+        a GET would get, without the body."""
+        out = ['%s %s' % (version, status)]
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'connection'):
+                out.append('%s: %s' % (name, value))
+        out.append('Content-Length: %d' % len(body))
+        if not keep_alive:
+            out.append('Connection: close')
+        if head:
+            body = b''
+        writer.write(('\r\n'.join(out) + '\r\n\r\n').encode('latin-1')
+                     + body)
+
+    async def serve(self, host='0.0.0.0', port=6543):
+        server = await asyncio.start_server(
+            self.handle, host, port, backlog=self.backlog,
+            limit=self.max_header_size)
+        async with server:
+            await server.serve_forever()
+
+class ASGIApplication(object):
+    """ An ASGI (3.0) application that runs a WSGI ``app`` in a pool of
+    ``threads`` threads."""
+    def __init__(self, app, threads=4):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        if scope.get('raw_path'):
+            # some servers leave the query string on raw_path
+            path = wsgi_path(scope['raw_path'].partition(b'?')[0])
+        else:
+            # already decoded, as text
+            path = scope['path'].encode('utf-8').decode('latin-1')
+        query = scope.get('query_string', b'').decode('latin-1')
+        headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                   for name, value in scope['headers']]
+        environ = make_environ(
+            scope['method'], path, query, 'HTTP/' + scope['http_version'],
+            headers, body, scope.get('server') or ('localhost', 80),
+            scope.get('client') or ('', 0))
+        loop = asyncio.get_event_loop()
+        status, response_headers, body = await loop.run_in_executor(
+            self.executor, call_wsgi, self.app, environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in response_headers],
+            })
+        await send({'type': 'http.response.body', 'body': body})
+
+async def _client(host, port, request, requests, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(requests):
+            start = time.time()
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.time() - start)
+    finally:
+        writer.close()
+
+def loadtest(host, port, path='/blog/1', cookie=None, connections=1000,
+             requests=20):
+    """ Open ``connections`` concurrent keep-alive connections, send
+    ``requests`` requests for ``path`` on each, and return the sorted
+    request latencies in seconds and the total elapsed time."""
+    lines = ['GET %s HTTP/1.1' % path, 'Host: %s:%d' % (host, port)]
+    if cookie:
+        lines.append('Cookie: %s' % cookie)
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    latencies = []
+    async def run():
+        await asyncio.gather(*[
+            _client(host, port, request, requests, latencies)
+            for i in range(connections)])
+    start = time.time()
+    asyncio.run(run())
+    return sorted(latencies), time.time() - start
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('filename', help='an app*.py script')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=6543)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args(argv[1:])
+    server = Server(load_app(args.filename), threads=args.threads)
+    asyncio.run(server.serve(args.host, args.port))
+
+if __name__ == '__main__':
+    main()
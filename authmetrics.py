@@ -0,0 +1,198 @@
+"""
+Latency histograms, decision counters and sampled traces for the
+authentication and authorization policies.
+
+``PYRAMID_DEBUG_AUTHORIZATION`` logs a line per permission check but says
+nothing about where the time goes.  Wrap the policies (and, if you like, the
+root factory and the ``AuthTktAuthenticationPolicy`` ticket parser) and
+expose what they record on a local endpoint::
+
+    metrics = Metrics()
+    authn_policy = AuthTktAuthenticationPolicy('soseekrit')
+    instrument_ticket_parser(authn_policy, metrics)
+    config = Configurator(
+        root_factory=metrics.timed('root_factory', root_factory),
+        authentication_policy=InstrumentedAuthenticationPolicy(
+            authn_policy, metrics),
+        authorization_policy=InstrumentedAuthorizationPolicy(
+            ACLAuthorizationPolicy(), metrics),
+        )
+    add_metrics_views(config, metrics)
+
+``GET /metrics`` then returns, in the Prometheus text format, a latency
+histogram per phase (``effective_principals``, ``permits``,
+``ticket_decode``, ``root_factory``) and allow/deny counts per permission
+and route.  ``GET /metrics/traces`` returns the most recent sampled
+decisions, one JSON object per line.  Both only answer requests whose
+connection comes from the local host (``REMOTE_ADDR``; ``X-Forwarded-For``
+is ignored, so behind a proxy on the same host they are open to everyone the
+proxy serves).
+
+Recording is a timer read, a bisect and a few increments per call, and only
+every ``sample_every``-th decision is traced, so it is cheap enough to leave
+on.  Nothing is locked, so under threads the counts are approximate.
+"""
+import bisect
+import collections
+import itertools
+import json
+import time
+import timeit
+
+from pyramid.httpexceptions import HTTPForbidden
+from pyramid.response import Response
+from pyramid.threadlocal import get_current_request
+
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+           0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class Metrics(object):
+    """ What the instrumented policies record."""
+    def __init__(self, sample_every=100, max_traces=1000, prefix='bikes'):
+        self.prefix = prefix
+        self.histograms = collections.defaultdict(Histogram)
+        self.decisions = collections.defaultdict(int)
+        self.sample_every = sample_every
+        self.traces = collections.deque(maxlen=max_traces)
+        self._calls = itertools.count()
+
+    def observe(self, phase, seconds):
+        self.histograms[phase].observe(seconds)
+
+    def timed(self, phase, func):
+        """ Return ``func`` wrapped so that its calls are timed as
+        ``phase``."""
+        timer = timeit.default_timer
+        def wrapper(*arg, **kw):
+            start = timer()
+            try:
+                return func(*arg, **kw)
+            finally:
+                self.observe(phase, timer() - start)
+        return wrapper
+
+    def decision(self, context, principals, permission, result):
+        request = get_current_request()
+        route = getattr(getattr(request, 'matched_route', None), 'name', '')
+        allowed = bool(result)
+        self.decisions[(permission, route, allowed)] += 1
+        if next(self._calls) % self.sample_every == 0:
+            self.traces.append({
+                'time': time.time(),
+                'route': route,
+                'permission': permission,
+                'principals': sorted(str(p) for p in principals),
+                'context': repr(context),
+                'allowed': allowed,
+                'reason': str(result),
+                })
+
+    def render(self):
+        """ Return the metrics in the Prometheus text exposition format."""
+        name = '%s_auth_phase_seconds' % self.prefix
+        lines = ['# HELP %s Time spent in authentication and '
+                 'authorization phases.' % name,
+                 '# TYPE %s histogram' % name]
+        for phase, histogram in sorted(self.histograms.items()):
+            labels = 'phase="%s"' % _escape(phase)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',),
+                                    histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, bound, cumulative))
+            lines.append('%s_sum{%s} %r' % (name, labels, histogram.sum))
+            lines.append('%s_count{%s} %d' % (name, labels, cumulative))
+        name = '%s_authz_decisions_total' % self.prefix
+        lines.extend(['# HELP %s Authorization decisions.' % name,
+                      '# TYPE %s counter' % name])
+        for (permission, route, allowed), count in sorted(
+                self.decisions.items()):
+            lines.append(
+                '%s{permission="%s",route="%s",decision="%s"} %d' % (
+                    name, _escape(permission), _escape(route),
+                    allowed and 'allow' or 'deny', count))
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+class InstrumentedAuthenticationPolicy(object):
+    """ Wrap an authentication policy, timing ``effective_principals`` and
+    ``authenticated_userid``."""
+    def __init__(self, policy, metrics):
+        self.policy = policy
+        self.effective_principals = metrics.timed(
+            'effective_principals', policy.effective_principals)
+        self.authenticated_userid = metrics.timed(
+            'authenticated_userid', policy.authenticated_userid)
+
+    def unauthenticated_userid(self, request):
+        return self.policy.unauthenticated_userid(request)
+
+    def remember(self, request, principal, **kw):
+        return self.policy.remember(request, principal, **kw)
+
+    def forget(self, request):
+        return self.policy.forget(request)
+
+class InstrumentedAuthorizationPolicy(object):
+    """ Wrap an authorization policy, timing ``permits`` and counting (and
+    sampling) its decisions."""
+    def __init__(self, policy, metrics):
+        self.policy = policy
+        self.metrics = metrics
+        self._permits = metrics.timed('permits', policy.permits)
+
+    def permits(self, context, principals, permission):
+        result = self._permits(context, principals, permission)
+        self.metrics.decision(context, principals, permission, result)
+        return result
+
+    def principals_allowed_by_permission(self, context, permission):
+        return self.policy.principals_allowed_by_permission(
+            context, permission)
+
+def instrument_ticket_parser(policy, metrics):
+    """ Time ticket decoding in an ``AuthTktAuthenticationPolicy``."""
+    cookie = policy.cookie
+    cookie.parse_ticket = metrics.timed('ticket_decode', cookie.parse_ticket)
+
+def add_metrics_views(config, metrics, path='/metrics'):
+    """ Serve ``metrics`` at ``path`` and its traces at ``path/traces``, to
+    local clients only."""
+    def local_only(view):
+        def wrapper(request):
+            # not client_addr, which a client can set with X-Forwarded-For
+            if request.remote_addr not in LOCAL_ADDRESSES:
+                raise HTTPForbidden()
+            return view(request)
+        return wrapper
+
+    def metrics_view(request):
+        return Response(metrics.render(),
+                        content_type='text/plain', charset='utf-8')
+
+    def traces_view(request):
+        body = ''.join(json.dumps(trace) + '\n'
+                       for trace in list(metrics.traces))
+        return Response(body, content_type='application/x-ndjson',
+                        charset='utf-8')
+
+    config.add_route('metrics', path)
+    config.add_route('metrics_traces', path.rstrip('/') + '/traces')
+    config.add_view(local_only(metrics_view), route_name='metrics')
+    config.add_view(local_only(traces_view), route_name='metrics_traces')
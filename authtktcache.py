@@ -0,0 +1,76 @@
+"""
+An ``AuthTktAuthenticationPolicy`` that remembers which tickets it has
+already validated.
+
+The stock policy parses the ``auth_tkt`` cookie and recomputes its digest on
+every request, even though one browser sends the same ticket over and over.
+``CachingAuthTktAuthenticationPolicy`` takes the same arguments, plus
+``cache_size`` and ``cache_max_age``, and puts a ``TicketCache`` in front of
+the ticket parser::
+
+    authn_policy = CachingAuthTktAuthenticationPolicy('soseekrit')
+
+Only tickets whose digest has been checked are cached, keyed on the exact
+secret, ticket, remote address and hash algorithm, so the cache never
+accepts a ticket that was not verified at least once.  An entry is dropped
+after ``cache_max_age`` seconds, or when the ticket itself times out if the
+policy has a ``timeout``, whichever comes first; the least recently used
+entry is dropped when there are more than ``cache_size``.  The policy still
+applies its own ``timeout`` and ``reissue_time`` checks to cached tickets.
+
+The digest itself is the one ``mod_auth_tkt`` defines, so it is not switched
+to an HMAC here: that would invalidate every ticket already issued and break
+interoperability with other ``auth_tkt`` implementations.  Pass
+``hashalg='sha512'`` for a stronger digest.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from pyramid.authentication import AuthTktAuthenticationPolicy
+
+class TicketCache(object):
+    """ A bounded, expiring cache in front of a ``parse_ticket`` function.
+    Exceptions (``BadTicket``) raised by the function are not cached."""
+    def __init__(self, parse_ticket, maxsize=10000, max_age=300,
+                 timeout=None):
+        self.parse_ticket = parse_ticket
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, secret, ticket, ip, hashalg='md5'):
+        key = (secret, ticket, ip, hashalg)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self.entries[key] = entry
+                self.hits += 1
+                timestamp, userid, tokens, user_data = entry[1]
+                return timestamp, userid, list(tokens), user_data
+        self.misses += 1
+        timestamp, userid, tokens, user_data = self.parse_ticket(
+            secret, ticket, ip, hashalg)
+        expires = now + self.max_age
+        if self.timeout:
+            expires = min(expires, timestamp + self.timeout)
+        with self.lock:
+            self.entries[key] = (
+                expires, (timestamp, userid, tuple(tokens), user_data))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return timestamp, userid, tokens, user_data
+
+class CachingAuthTktAuthenticationPolicy(AuthTktAuthenticationPolicy):
+    """ ``AuthTktAuthenticationPolicy`` with a ``TicketCache``."""
+    def __init__(self, secret, cache_size=10000, cache_max_age=300, **kw):
+        AuthTktAuthenticationPolicy.__init__(self, secret, **kw)
+        cookie = self.cookie
+        cookie.parse_ticket = TicketCache(
+            cookie.parse_ticket, maxsize=cache_size, max_age=cache_max_age,
+            timeout=cookie.timeout)
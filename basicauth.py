@@ -0,0 +1,160 @@
+"""
+HTTP Basic authentication against slow password hashes, without spending
+all the CPU on them.
+
+Web service clients send their username and password on every request
+(the app4 notes mention ``BasicAuthAuthenticationPolicy``), and a password
+hash worth storing takes tens of milliseconds to compute.
+``CachingBasicAuthAuthenticationPolicy`` is Pyramid's
+``BasicAuthAuthenticationPolicy`` with a ``PasswordChecker`` as its
+``check``::
+
+    users = {'fred': hash_password('fredpassword')}
+    authn_policy = CachingBasicAuthAuthenticationPolicy(users)
+    config = Configurator(authentication_policy=authn_policy, ...)
+
+The checker computes PBKDF2 hashes in a pool of ``workers`` processes, so a
+request waiting for one does not hold the GIL other requests' threads need,
+and at most ``max_pending`` checks wait for the pool at once.  A successful
+check is remembered for ``cache_ttl`` seconds (the ``cache_size`` most
+recently used ones) under an HMAC, with a per-process random key, of the
+username, the stored hash and the password, so the cache holds no password
+and changing a user's password invalidates its entries at once.  Failed
+checks are not cached.  Unknown users are checked against a dummy hash, so
+they take as long to reject as wrong passwords.
+
+It works as one member of a ``pyramid_multiauth`` chain.  Put the cheap
+cookie policy first so browsers never get as far as a password check::
+
+    authn_policy = MultiAuthenticationPolicy([
+        AuthTktAuthenticationPolicy('soseekrit'),
+        CachingBasicAuthAuthenticationPolicy(users),
+        ])
+
+The chain asks every policy for its principals, so the checker also
+remembers its answer on the request; Pyramid's Basic policy would otherwise
+check the same credentials twice per request.
+
+This needs ``concurrent.futures`` (Python 3).
+"""
+import binascii
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from pyramid.authentication import BasicAuthAuthenticationPolicy
+
+ITERATIONS = 100000
+
+def hash_password(password, iterations=ITERATIONS, salt=None):
+    """ Return ``password`` hashed for storage, as
+    ``pbkdf2_sha256$<iterations>$<salt>$<hash>``."""
+    if salt is None:
+        salt = binascii.hexlify(os.urandom(16)).decode('ascii')
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                                 salt.encode('ascii'), iterations)
+    return 'pbkdf2_sha256$%d$%s$%s' % (
+        iterations, salt, binascii.hexlify(digest).decode('ascii'))
+
+def verify_password(password, encoded):
+    try:
+        algorithm, iterations, salt, digest = encoded.split('$')
+        iterations = int(iterations)
+    except ValueError:
+        return False
+    if algorithm != 'pbkdf2_sha256':
+        return False
+    return hmac.compare_digest(hash_password(password, iterations, salt),
+                               encoded)
+
+class CheckerBusy(Exception):
+    """ Raised by ``PasswordChecker.verify(block=False)`` when
+    ``max_pending`` checks are already waiting for the pool."""
+
+class PasswordChecker(object):
+    """ A ``check`` callback for ``BasicAuthAuthenticationPolicy``.
+    ``users`` maps userids to hashes made by ``hash_password``;
+    ``groupfinder(userid, request)`` returns the user's extra principals."""
+    def __init__(self, users, groupfinder=None, workers=2, max_pending=None,
+                 cache_size=10000, cache_ttl=60):
+        self.users = users
+        self.groupfinder = groupfinder
+        self.workers = workers
+        self.pending = threading.BoundedSemaphore(max_pending or workers * 4)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.key = os.urandom(32)
+        self.executor = None
+        self.executor_pid = None
+        self.dummy_hash = None
+        self.hits = 0
+        self.misses = 0
+
+    def _executor(self):
+        # started on first use, and again after a fork (prefork.py)
+        with self.lock:
+            if self.executor_pid != os.getpid():
+                self.executor = ProcessPoolExecutor(self.workers)
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    def verify(self, userid, password, block=True):
+        """ Return whether ``password`` is ``userid``'s.  Unless ``block``,
+        raise ``CheckerBusy`` rather than wait for a place in the pool."""
+        encoded = self.users.get(userid)
+        if encoded is None:
+            if self.dummy_hash is None:
+                self.dummy_hash = hash_password(u'', salt='0' * 32)
+            encoded = self.dummy_hash
+            userid = None
+        key = hmac.new(self.key, u'\0'.join(
+            (userid or u'', encoded, password)).encode('utf-8'),
+            hashlib.sha256).digest()
+        now = time.time()
+        with self.lock:
+            expires = self.cache.pop(key, None)
+            if expires is not None and expires > now:
+                self.cache[key] = expires
+                self.hits += 1
+                return True
+        self.misses += 1
+        if not self.pending.acquire(block):
+            raise CheckerBusy()
+        try:
+            verified = self._executor().submit(
+                verify_password, password, encoded).result()
+        finally:
+            self.pending.release()
+        if verified and userid is not None:
+            with self.lock:
+                self.cache[key] = now + self.cache_ttl
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return verified and userid is not None
+
+    def __call__(self, username, password, request):
+        checked = getattr(request, '_basic_auth_checked', None)
+        if checked is not None and checked[0] == (username, password):
+            verified = checked[1]
+        else:
+            verified = self.verify(username, password)
+            request._basic_auth_checked = (username, password), verified
+        if not verified:
+            return None
+        if self.groupfinder is None:
+            return []
+        return self.groupfinder(username, request)
+
+class CachingBasicAuthAuthenticationPolicy(BasicAuthAuthenticationPolicy):
+    """ ``BasicAuthAuthenticationPolicy`` checking passwords with a
+    ``PasswordChecker``; the other keyword arguments are the checker's."""
+    def __init__(self, users, realm='Realm', groupfinder=None, debug=False,
+                 **kw):
+        BasicAuthAuthenticationPolicy.__init__(
+            self, PasswordChecker(users, groupfinder, **kw), realm, debug)
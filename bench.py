@@ -0,0 +1,987 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the demo applications.
+
+Run ``python bench.py <name> [args...]``; ``python bench.py`` lists the
+available benchmarks.  Each benchmark drives the WSGI application in-process
+(no sockets) using WebOb's ``Request.blank``.
+"""
+import sys
+import timeit
+
+from webob import Request
+
+BENCHMARKS = {}
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+def rate(func, seconds=1.0):
+    """ Call ``func`` repeatedly for at least ``seconds`` (and at least once)
+    and return the number of calls per second."""
+    timer = timeit.default_timer
+    calls = 0
+    start = timer()
+    while True:
+        func()
+        calls += 1
+        elapsed = timer() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+def peak_bytes(func, calls=200):
+    """ Return the average, over ``calls`` calls of ``func``, of the peak
+    memory (in bytes, as traced by tracemalloc) allocated during a call."""
+    import tracemalloc
+    func()
+    tracemalloc.start()
+    total = 0
+    try:
+        for i in range(calls):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func()
+            total += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return total / float(calls)
+
+def allocations(func, calls=200):
+    """ Return the average number of memory blocks allocated by a call of
+    ``func``, counted by watching ``sys.getallocatedblocks()`` at every call
+    and return (Python or C) during it.  It is a lower bound: a block
+    allocated and freed between two of those is not seen, and neither is an
+    object reused from one of CPython's free lists."""
+    getallocatedblocks = sys.getallocatedblocks
+    def count(func):
+        # allocated so far, and blocks in use at the last event
+        state = [0, 0]
+        def profile(frame, event, arg):
+            now = getallocatedblocks()
+            if now > state[1]:
+                state[0] += now - state[1]
+            state[1] = now
+        func()
+        state[1] = getallocatedblocks()
+        sys.setprofile(profile)
+        try:
+            for i in range(calls):
+                func()
+        finally:
+            sys.setprofile(None)
+        return state[0] / float(calls)
+    # less what the counting itself allocates around a call
+    return max(count(func) - count(lambda: None), 0)
+
+def make_app7(root_factory=None, authentication_policy=None,
+              authorization_policy=None):
+    from pyramid.config import Configurator
+    from pyramid.authentication import AuthTktAuthenticationPolicy
+    from pyramid.authorization import ACLAuthorizationPolicy
+    import app7
+    from throttle import LoginThrottle
+    # a fresh login throttle per app, so the logins benchmarks make to get
+    # cookies are not throttled by earlier ones in the same process
+    app7.login_throttle = LoginThrottle()
+    if root_factory is None:
+        root_factory = app7.root_factory
+    if authentication_policy is None:
+        authentication_policy = AuthTktAuthenticationPolicy('soseekrit')
+    if authorization_policy is None:
+        authorization_policy = ACLAuthorizationPolicy()
+    config = Configurator(
+        root_factory=root_factory,
+        authentication_policy=authentication_policy,
+        authorization_policy=authorization_policy
+        )
+    config.add_route('blogentry_show', '/blog/{id}')
+    config.add_route('blogentry_delete', '/blog/{id}/delete',
+                     traverse='/{id}')
+    config.add_route('login', '/login')
+    config.add_route('logout', '/logout')
+    config.scan('app7')
+    return config.make_wsgi_app()
+
+def login_cookie(app, userid):
+    response = Request.blank('/login?userid=%s' % userid).get_response(app)
+    if response.status_int == 429:
+        raise RuntimeError('login as %s was throttled' % userid)
+    for name, value in response.headerlist:
+        if name == 'Set-Cookie':
+            return value.split(';', 1)[0]
+
+@benchmark
+def tree(*sizes):
+    """ Requests per second for ``/blog/1/delete`` in app7 with a resource
+    tree built per request versus one shared tree."""
+    import app7
+    sizes = [int(size) for size in sizes] or [10, 10000, 1000000]
+    for size in sizes:
+        names = [str(i) for i in range(size)]
+        shared = app7.make_root(names)
+        factories = (
+            ('per-request', lambda request: app7.make_root(names)),
+            ('shared', lambda request: shared),
+            )
+        for label, factory in factories:
+            app = make_app7(factory)
+            request = Request.blank('/blog/1/delete')
+            request.headers['Cookie'] = login_cookie(app, 'joe')
+            def call():
+                request.copy().get_response(app)
+            print('%-12s %9d entries %12.1f req/s' % (
+                label, size, rate(call)))
+
+@benchmark
+def treestore(size=2000000):
+    """ Dump a tree of ``size`` blog entries with ``treestore``, then time
+    opening it and traversing to entries in it."""
+    import itertools
+    import os
+    import tempfile
+    import app7
+    import treestore
+    size = int(size)
+    timer = timeit.default_timer
+    names = [str(i) for i in range(size)]
+    filename = os.path.join(tempfile.mkdtemp(), 'blog.tree')
+    start = timer()
+    treestore.dump(app7.make_root(names), filename)
+    print('dump       %10.1f ms  %d bytes' % (
+        (timer() - start) * 1000, os.path.getsize(filename)))
+    start = timer()
+    root = treestore.open_tree(filename)
+    print('open       %10.3f ms' % ((timer() - start) * 1000))
+    names = itertools.cycle(names)
+    def lookup():
+        root[next(names)].__acl__
+    print('lookup     %10.1f /s' % rate(lookup))
+    root.store.close()
+    os.remove(filename)
+
+class PlainResource(object):
+    # app7's Resource before it grew __slots__ and a weak __parent__
+    def __init__(self, name='', acl=None, parent=None):
+        self.children = {}
+        self.__name__ = name
+        self.__parent__ = parent
+        if acl is not None:
+            self.__acl__ = acl
+
+def make_plain_root(names):
+    from pyramid.security import Allow, Authenticated
+    root = PlainResource('', acl=[(Allow, 'fred', 'delete')])
+    for name in names:
+        root.children[name] = PlainResource(
+            name, acl=[(Allow, Authenticated, 'delete')], parent=root)
+    return root
+
+@benchmark
+def memory(size=1000000):
+    """ Memory used by, and full gc pause times with, a tree of ``size``
+    blog entries built from app7's Resource and from a plain
+    ``__dict__``-based resource class."""
+    import gc
+    import tracemalloc
+    import app7
+    size = int(size)
+    timer = timeit.default_timer
+    for label, make_root in (('plain', make_plain_root),
+                             ('app7', app7.make_root)):
+        names = [str(i) for i in range(size)]
+        gc.collect()
+        tracemalloc.start()
+        root = make_root(names)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        pauses = []
+        for i in range(5):
+            start = timer()
+            gc.collect()
+            pauses.append(timer() - start)
+        print('%-6s %9d entries %8.1f MB  gc pause %7.1f ms (max %.1f)' % (
+            label, size, used / 1048576.0,
+            sum(pauses) / len(pauses) * 1000, max(pauses) * 1000))
+        del root, names
+
+def make_chain(depth):
+    """ Return the deepest node of a chain of ``depth`` app7 Resources below
+    a root, each with an ACL that does not mention 'fred'."""
+    import app7
+    from pyramid.security import Allow, Deny
+    root = node = app7.Resource('', acl=[(Allow, 'fred', 'delete')])
+    for i in range(depth):
+        node.add_subresource('n', acl=[(Allow, 'joe', 'delete'),
+                                       (Deny, 'bob', 'view')])
+        node = node['n']
+    return root, node
+
+@benchmark
+def aclindex(*depths):
+    """ permits() calls per second for ACLAuthorizationPolicy,
+    IndexedACLAuthorizationPolicy and CompiledACLAuthorizationPolicy on
+    nodes at increasing depths."""
+    from pyramid.authorization import ACLAuthorizationPolicy
+    from pyramid.security import Authenticated, Everyone
+    from aclcompile import CompiledACLAuthorizationPolicy
+    from aclindex import IndexedACLAuthorizationPolicy
+    depths = [int(depth) for depth in depths] or [1, 10, 100, 1000]
+    principals = [Everyone, Authenticated, 'fred']
+    for depth in depths:
+        root, node = make_chain(depth)
+        for policy in (ACLAuthorizationPolicy(),
+                       IndexedACLAuthorizationPolicy(),
+                       CompiledACLAuthorizationPolicy()):
+            def check():
+                policy.permits(node, principals, 'delete')
+            print('%-30s depth %5d %12.1f checks/s' % (
+                policy.__class__.__name__, depth, rate(check)))
+
+@benchmark
+def permits_many(size=500):
+    """ Time to decide which of ``size`` app7 blog entries 'joe' may
+    delete, one traversal and permits() call per entry versus one
+    IndexedACLAuthorizationPolicy.permits_many() call."""
+    import app7
+    from pyramid.authorization import ACLAuthorizationPolicy
+    from pyramid.security import Authenticated, Everyone
+    from pyramid.traversal import traverse
+    from aclindex import IndexedACLAuthorizationPolicy
+    size = int(size)
+    root = app7.make_root([str(i) for i in range(0, size, 2)])
+    paths = ['/%d' % i for i in range(size)]
+    principals = [Everyone, Authenticated, 'joe']
+    stock = ACLAuthorizationPolicy()
+    indexed = IndexedACLAuthorizationPolicy()
+    def one_by_one():
+        return [bool(stock.permits(traverse(root, path)['context'], principals,
+                                   'delete'))
+                for path in paths]
+    def batched():
+        return indexed.permits_many(root, principals, 'delete', paths)
+    assert one_by_one() == batched()
+    for label, func in (('one-by-one', one_by_one), ('permits_many', batched)):
+        print('%-14s %5d entries %10.3f ms/page' % (
+            label, size, 1000 / rate(func)))
+
+@benchmark
+def authtkt():
+    """ Authenticated requests per second for app7's ``/blog/1/delete``
+    with AuthTktAuthenticationPolicy and with
+    CachingAuthTktAuthenticationPolicy."""
+    from pyramid.authentication import AuthTktAuthenticationPolicy
+    from authtktcache import CachingAuthTktAuthenticationPolicy
+    for policy in (AuthTktAuthenticationPolicy('soseekrit', hashalg='sha512'),
+                   CachingAuthTktAuthenticationPolicy('soseekrit',
+                                                      hashalg='sha512')):
+        app = make_app7(authentication_policy=policy)
+        request = Request.blank('/blog/1/delete')
+        request.headers['Cookie'] = login_cookie(app, 'joe')
+        assert request.copy().get_response(app).status_int == 200
+        def call():
+            request.copy().get_response(app)
+        print('%-36s %10.1f req/s' % (policy.__class__.__name__, rate(call)))
+    def identify():
+        policy.cookie.identify(request)
+    print('%-36s %10.1f /s' % ('identify (cached)', rate(identify)))
+    policy.cookie.parse_ticket = policy.cookie.parse_ticket.parse_ticket
+    print('%-36s %10.1f /s' % ('identify (uncached)', rate(identify)))
+
+def wait_for_port(host, port, timeout=30):
+    import socket
+    import time
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), 1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+@benchmark
+def latency(connections=1000, requests=20, threads=4):
+    """ Tail latency of app7 under ``connections`` concurrent keep-alive
+    clients when served by waitress and by asyncserve.  Needs Python 3."""
+    import resource
+    import subprocess
+    from asyncserve import loadtest
+    connections, requests, threads = (
+        int(connections), int(requests), int(threads))
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    host, port = '127.0.0.1', 6599
+    servers = (
+        ('waitress', [
+            sys.executable, '-c',
+            'import logging, apploader, waitress;'
+            ' logging.getLogger("waitress.queue").setLevel(logging.ERROR);'
+            ' waitress.serve('
+            'apploader.load_app("app7.py"), host="%s", port=%d, threads=%d,'
+            ' connection_limit=%d, _quiet=True)' % (
+                host, port, threads, connections + 100)]),
+        ('asyncserve', [
+            sys.executable, 'asyncserve.py', 'app7.py', '--host', host,
+            '--port', str(port), '--threads', str(threads)]),
+        )
+    for label, command in servers:
+        server = subprocess.Popen(command)
+        try:
+            wait_for_port(host, port)
+            latencies, elapsed = loadtest(
+                host, port, connections=connections, requests=requests)
+        finally:
+            server.terminate()
+            server.wait()
+        def percentile(p):
+            return latencies[min(len(latencies) - 1,
+                                 int(len(latencies) * p))] * 1000
+        print('%-10s %5d conns %9.1f req/s  p50 %7.1f ms  p99 %7.1f ms'
+              '  max %7.1f ms' % (
+                  label, connections, len(latencies) / elapsed,
+                  percentile(0.5), percentile(0.99), latencies[-1] * 1000))
+
+@benchmark
+def groups(total=100000, depth=50):
+    """ Time to resolve the groups of a user who is in ``depth`` nested
+    groups out of ``total``, cold, cached, and after a membership
+    change."""
+    import random
+    from groups import GroupGraph
+    total, depth = int(total), int(depth)
+    timer = timeit.default_timer
+    graph = GroupGraph()
+    rng = random.Random(42)
+    for i in range(depth, total):
+        graph.add('group:%d' % i, 'group:%d' % rng.randrange(depth, total))
+    graph.add('fred', 'group:0')
+    for i in range(depth - 1):
+        graph.add('group:%d' % i, 'group:%d' % (i + 1))
+    start = timer()
+    found = graph.groups('fred')
+    print('cold       %10.1f us  (%d groups)' % (
+        (timer() - start) * 1e6, len(found)))
+    def lookup():
+        graph.groupfinder('fred', None)
+    print('cached     %10.3f us' % (1e6 / rate(lookup)))
+    graph.add('group:%d' % (depth // 2), 'group:extra')
+    start = timer()
+    found = graph.groups('fred')
+    print('changed    %10.1f us  (%d groups)' % (
+        (timer() - start) * 1e6, len(found)))
+
+def route_table(config, size, nested=False):
+    """ Add ``size`` routes shaped like the demo apps' to ``config``,
+    ending with the apps' own four.  With ``nested``, the extra blogs live
+    under ``/blog/<n>/`` rather than ``/blog<n>/``."""
+    blog = '/blog/%d' if nested else '/blog%d'
+    for i in range(size // 4 - 1):
+        config.add_route('show%d' % i, blog % i + '/{id}')
+        config.add_route('delete%d' % i, blog % i + '/{id}/delete',
+                         traverse='/{id}')
+        config.add_route('login%d' % i, '/login%d' % i)
+        config.add_route('logout%d' % i, '/logout%d' % i)
+    config.add_route('blogentry_show', '/blog/{id}')
+    config.add_route('blogentry_delete', '/blog/{id}/delete',
+                     traverse='/{id}')
+    config.add_route('login', '/login')
+    config.add_route('logout', '/logout')
+
+@benchmark
+def router(*sizes):
+    """ Route matches per second with Pyramid's RoutesMapper and with
+    PrefixRoutesMapper for tables of 10 to 10k routes, with the extra blogs
+    at ``/blog<n>/`` (flat) and under ``/blog/<n>/`` (nested)."""
+    from pyramid.config import Configurator
+    from pyramid.interfaces import IRoutesMapper
+    from router import use_prefix_router
+    sizes = [int(size) for size in sizes] or [10, 100, 1000, 10000]
+    for nested in (False, True):
+        blog = '/blog/0' if nested else '/blog0'
+        layout = 'nested' if nested else 'flat'
+        paths = ['/blog/1', '/blog/1/delete', '/login', '/logout',
+                 blog + '/7', blog + '/7/delete', '/nowhere']
+        for size in sizes:
+            mappers = []
+            for label, setup in (('RoutesMapper', None),
+                                 ('PrefixRoutesMapper', use_prefix_router)):
+                config = Configurator()
+                if setup is not None:
+                    setup(config)
+                route_table(config, size, nested)
+                config.commit()
+                mappers.append(
+                    (label, config.registry.getUtility(IRoutesMapper)))
+            results = []
+            for label, mapper in mappers:
+                found = []
+                for path in paths:
+                    info = mapper(Request.blank(path))
+                    found.append((info['route'] and info['route'].name,
+                                  info['match']))
+                results.append(found)
+                requests = [Request.blank(path) for path in paths]
+                def match():
+                    for request in requests:
+                        mapper(request)
+                print('%-20s %-6s %6d routes %12.1f matches/s' % (
+                    label, layout, size, rate(match) * len(paths)))
+            assert results[0] == results[1], results
+
+@benchmark
+def responses():
+    """ Requests per second, and memory blocks and peak bytes allocated per
+    request, for a view returning a new Response and one returning a
+    ConstantResponse."""
+    from pyramid.config import Configurator
+    from pyramid.response import Response
+    from constresponse import ConstantResponse
+    shown = ConstantResponse('Shown')
+    for label, view in (('Response', lambda request: Response('Shown')),
+                        ('ConstantResponse', lambda request: shown)):
+        config = Configurator()
+        config.add_route('blogentry_show', '/blog/{id}')
+        config.add_view(view, route_name='blogentry_show')
+        app = config.make_wsgi_app()
+        environ = Request.blank('/blog/1').environ
+        def call():
+            b''.join(app(dict(environ), lambda status, headers: None))
+        print('%-18s %10.1f req/s %6.0f blocks/request'
+              ' %8.0f peak bytes/request' % (
+                  label, rate(call), allocations(call), peak_bytes(call)))
+
+@benchmark
+def cookies(*counts):
+    """ Reads per second of the ``userid`` cookie from a fresh request
+    whose Cookie header holds 1, 20 and 100 cookies (or ``counts``), with
+    WebOb's request.cookies and with lazycookies.LazyCookies, on their
+    own; ``cookieapps`` times whole requests."""
+    from webob.cookies import RequestCookies
+    from lazycookies import LazyCookies
+    for count in [int(count) for count in counts] or [1, 20, 100]:
+        pairs = ['_ga%d=GA1.2.%d.1700000000' % (i, 1000000 + i)
+                 for i in range(count - 1)]
+        pairs.insert(len(pairs) // 2, 'userid=fred')
+        environ = {'HTTP_COOKIE': '; '.join(pairs)}
+        for label, cookies in (('RequestCookies', RequestCookies),
+                               ('LazyCookies', LazyCookies)):
+            assert cookies(dict(environ)).get('userid') == 'fred'
+            def read():
+                cookies(dict(environ)).get('userid')
+            print('%4d cookies %-15s %10.1f reads/s' % (
+                count, label, rate(read)))
+
+@benchmark
+def cookieapps(*counts):
+    """ Requests per second through demo.py, app2.py, app3.py and app7.py,
+    loaded with apploader, with and without ``config.include('lazycookies')``,
+    for a request without cookies and for one holding the app's own cookie
+    among 0, 1, 20 and 100 (or ``counts``) others."""
+    import os
+    import shutil
+    import tempfile
+    import lazycookies
+    from apploader import load_app
+    here = os.path.dirname(os.path.abspath(__file__))
+    counts = [int(count) for count in counts] or [0, 1, 20, 100]
+    # script, anonymous path, path needing a cookie, path setting it (or
+    # the cookie: demo.py's /set fails on Python 3)
+    scripts = (('demo.py', None, '/show', 'foo=1'),
+               ('app2.py', '/blog/1', '/blog/1/delete', '/login?userid=fred'),
+               ('app3.py', '/blog/1', '/blog/1/delete', '/login?userid=fred'),
+               ('app7.py', '/blog/1', '/blog/1/delete', '/login?userid=fred'))
+    includeme = lazycookies.includeme
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    # app7 keeps its revocation list in the current directory
+    os.chdir(tmpdir)
+    try:
+        for script, anonymous, path, setter in scripts:
+            apps = []
+            for label, include in (('webob', lambda config: None),
+                                   ('lazycookies', includeme)):
+                lazycookies.includeme = include
+                try:
+                    apps.append((label, load_app(os.path.join(here, script))))
+                except SyntaxError: # app2.py is Python 2 only
+                    break
+                finally:
+                    lazycookies.includeme = includeme
+            if not apps:
+                print('%-8s skipped (Python 2 only)' % script)
+                continue
+            cookie = setter
+            if setter.startswith('/'):
+                cookie = Request.blank(setter).get_response(
+                    apps[0][1]).headers['Set-Cookie'].split(';')[0]
+            cases = []
+            if anonymous is not None:
+                cases.append(('no cookies', anonymous, None))
+            for count in counts:
+                others = ['_ga%d=GA1.2.%d.1700000000' % (i, 1000000 + i)
+                          for i in range(count)]
+                others.insert(len(others) // 2, cookie)
+                cases.append(('%d+1 cookies' % count, path,
+                              '; '.join(others)))
+            for case, case_path, header in cases:
+                rates = []
+                for label, app in apps:
+                    request = Request.blank(case_path)
+                    if header is not None:
+                        request.headers['Cookie'] = header
+                    status = request.copy().get_response(app).status_int
+                    assert status == 200, (script, label, case, status)
+                    def call():
+                        request.copy().get_response(app)
+                    rates.append(rate(call))
+                print('%-8s %-15s webob %9.1f  lazycookies %9.1f req/s'
+                      ' (%+.0f%%)' % (script, case, rates[0], rates[1],
+                                      (rates[1] / rates[0] - 1) * 100))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+@benchmark
+def revocation(revoked=10000):
+    """ Authenticated requests per second for app7's ``/blog/1/delete``
+    with AuthTktAuthenticationPolicy, with it wrapped in
+    RevokingAuthenticationPolicy (``revoked`` other tickets revoked), and how
+    long a logout takes to reach a second RevocationList on the same
+    file."""
+    import os
+    import shutil
+    import tempfile
+    import time
+    from pyramid.authentication import AuthTktAuthenticationPolicy
+    from revocation import RevocationList, RevokingAuthenticationPolicy
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'revoked.db')
+    revocations = RevocationList(filename)
+    for i in range(int(revoked)):
+        revocations.revoke('ticket%d' % i, 3600)
+    for label, policy in (
+            ('AuthTktAuthenticationPolicy',
+             AuthTktAuthenticationPolicy('soseekrit')),
+            ('RevokingAuthenticationPolicy',
+             RevokingAuthenticationPolicy(
+                 AuthTktAuthenticationPolicy('soseekrit'), revocations))):
+        app = make_app7(authentication_policy=policy)
+        request = Request.blank('/blog/1/delete')
+        request.headers['Cookie'] = login_cookie(app, 'joe')
+        assert request.copy().get_response(app).status_int == 200
+        def call():
+            request.copy().get_response(app)
+        print('%-36s %10.1f req/s' % (label, rate(call)))
+    other = RevocationList(filename, refresh_interval=0.1)
+    other_app = make_app7(authentication_policy=RevokingAuthenticationPolicy(
+        AuthTktAuthenticationPolicy('soseekrit'), other))
+    logout = request.copy()
+    logout.path_info = '/logout'
+    logout.get_response(app)
+    assert request.copy().get_response(app).status_int == 403
+    start = time.time()
+    while request.copy().get_response(other_app).status_int != 403:
+        time.sleep(0.001)
+    print('%-36s %10.1f ms' % ('logout seen by other worker after',
+                               (time.time() - start) * 1000))
+    shutil.rmtree(tmpdir)
+
+@benchmark
+def slides(blocks=500):
+    """ Time to build an S5 deck of ``blocks`` sourcecode blocks (taken from
+    the app*.py files) with rst-directive.py: highlighting every block the
+    way it used to, a build with an empty cache, a build with nothing
+    changed and one with one block changed."""
+    import glob
+    import importlib.util
+    import os
+    import shutil
+    import tempfile
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    here = os.path.dirname(os.path.abspath(__file__))
+    # imported under a name the highlighting processes can find it by
+    spec = importlib.util.spec_from_file_location(
+        'rst_directive', os.path.join(here, 'rst-directive.py'))
+    module = sys.modules['rst_directive'] = importlib.util.module_from_spec(
+        spec)
+    spec.loader.exec_module(module)
+    directive = vars(module)
+    timer = timeit.default_timer
+    sources = []
+    for filename in sorted(glob.glob(os.path.join(here, 'app*.py'))):
+        with open(filename) as f:
+            sources.append(f.read())
+    lines = ['Slides\n======\n']
+    for i in range(int(blocks)):
+        # make every block different, as it would be in a real deck
+        source = '# slide %d\n' % i + sources[i % len(sources)]
+        lines.append('\nSlide %d\n--------\n\n.. sourcecode:: python\n\n' % i)
+        lines.extend('    %s\n' % line if line.strip() else '\n'
+                     for line in source.splitlines())
+    document = ''.join(lines)
+    def lookup():
+        get_lexer_by_name('python')
+    print('%-22s %10.1f /s' % ('get_lexer_by_name', rate(lookup)))
+    def cached_lookup():
+        directive['get_lexer']('python')
+    print('%-22s %10.1f /s' % ('cached get_lexer', rate(cached_lookup)))
+    start = timer()
+    for i in range(int(blocks)):
+        highlight(sources[i % len(sources)], get_lexer_by_name('python'),
+                  directive['DEFAULT'])
+    print('%-22s %10.1f ms' % ('highlight every block',
+                               (timer() - start) * 1000))
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(tmpdir)
+    try:
+        def build(label):
+            with open('slides.rst', 'w') as f:
+                f.write(document)
+            start = timer()
+            directive['main'](['--theme-url=ui/pretty', '--quiet',
+                               'slides.rst', 'slides.html'])
+            print('%-22s %10.1f ms' % (label, (timer() - start) * 1000))
+        build('empty cache')
+        build('nothing changed')
+        document = document.replace('# slide 7\n', '# slide 7, edited\n')
+        build('one block changed')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+@benchmark
+def rowsecurity(size=100000):
+    """ Time to list the blog entries 'fred' may delete, out of ``size``
+    entries of which 1% give fred the permission: checking every app7
+    Resource with ACLAuthorizationPolicy, and with an EntryStore condition
+    (all of them, the first page of 20 and a count)."""
+    from pyramid.authorization import ACLAuthorizationPolicy
+    from pyramid.security import Allow, Authenticated, Everyone
+    import app7
+    from rowsecurity import EntryStore
+    size = int(size)
+    timer = timeit.default_timer
+    principals = [Everyone, Authenticated, 'fred']
+    acls = [[(Allow, 'fred', 'delete')] if i % 100 == 0 else
+            [(Allow, 'joe', 'view')] for i in range(size)]
+    root = app7.Resource('', acl=[(Allow, 'group:admins', 'delete')])
+    children = {}
+    for i, acl in enumerate(acls):
+        children[str(i)] = app7.Resource(str(i), acl=acl, parent=root)
+    root.children = children
+    start = timer()
+    store = EntryStore(root)
+    store.add_many((str(i), acl) for i, acl in enumerate(acls))
+    print('%-24s %10.1f ms' % ('load EntryStore', (timer() - start) * 1000))
+    policy = ACLAuthorizationPolicy()
+    start = timer()
+    expected = [name for name, child in children.items()
+                if policy.permits(child, principals, 'delete')]
+    print('%-24s %10.1f ms' % ('ACLAuthorizationPolicy',
+                               (timer() - start) * 1000))
+    start = timer()
+    got = store.entries(principals, 'delete')
+    print('%-24s %10.1f ms' % ('EntryStore.entries', (timer() - start) * 1000))
+    assert [name for entry_id, name in got] == expected
+    start = timer()
+    store.entries(principals, 'delete', limit=20, after=got[len(got) // 2][0])
+    print('%-24s %10.1f ms' % ('EntryStore page of 20',
+                               (timer() - start) * 1000))
+    start = timer()
+    assert store.count(principals, 'delete') == len(expected)
+    print('%-24s %10.1f ms' % ('EntryStore.count', (timer() - start) * 1000))
+
+@benchmark
+def basicauth(threads=4):
+    """ Requests per second for app7's ``/blog/1/delete`` with HTTP Basic
+    credentials from ``threads`` threads, with BasicAuthAuthenticationPolicy
+    hashing the password in the request thread and with
+    CachingBasicAuthAuthenticationPolicy."""
+    import base64
+    import threading
+    import time
+    from pyramid.authentication import BasicAuthAuthenticationPolicy
+    from basicauth import CachingBasicAuthAuthenticationPolicy
+    from basicauth import hash_password, verify_password
+    users = {'joe': hash_password('joepassword')}
+    def check(username, password, request):
+        encoded = users.get(username)
+        if encoded is not None and verify_password(password, encoded):
+            return []
+    threads = int(threads)
+    for policy in (BasicAuthAuthenticationPolicy(check),
+                   CachingBasicAuthAuthenticationPolicy(users)):
+        app = make_app7(authentication_policy=policy)
+        request = Request.blank('/blog/1/delete')
+        request.authorization = ('Basic', base64.b64encode(
+            b'joe:joepassword').decode('ascii'))
+        assert request.copy().get_response(app).status_int == 200
+        counts = [0] * threads
+        stop = time.time() + 2
+        def run(i):
+            while time.time() < stop:
+                request.copy().get_response(app)
+                counts[i] += 1
+        workers = [threading.Thread(target=run, args=(i,))
+                   for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        print('%-38s %10.1f req/s' % (policy.__class__.__name__,
+                                      sum(counts) / 2.0))
+    checker = policy.check
+    print('%-38s %10.3f' % ('cache hit rate', checker.hits / float(
+        checker.hits + checker.misses)))
+
+@benchmark
+def throttle(keys=100000):
+    """ LoginThrottle checks per second over ``keys`` distinct userids and
+    addresses and the memory they take, then app7 logins per second when
+    allowed and when throttled."""
+    import tracemalloc
+    import app7
+    from throttle import LoginThrottle
+    keys = int(keys)
+    login_throttle = LoginThrottle()
+    names = iter(range(10 ** 9))
+    def allow():
+        i = next(names) % keys
+        login_throttle.allow('user%d' % i, '10.%d.%d.%d' % (
+            i >> 16, (i >> 8) & 255, i & 255))
+    print('%-24s %10.1f /s' % ('LoginThrottle.allow', rate(allow)))
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    login_throttle = LoginThrottle()
+    for i in range(keys):
+        allow()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    print('%-24s %10.1f bytes' % ('per user and address', used / keys))
+    app = make_app7()
+    addresses = iter(range(10 ** 9))
+    def login():
+        i = next(addresses)
+        Request.blank('/login?userid=user%d' % i, remote_addr='10.%d.%d.%d' % (
+            i >> 16 & 255, (i >> 8) & 255, i & 255)).get_response(app)
+    print('%-24s %10.1f req/s' % ('login allowed', rate(login)))
+    request = Request.blank('/login?userid=fred', remote_addr='10.0.0.1')
+    while request.copy().get_response(app).status_int != 429:
+        pass
+    def throttled():
+        request.copy().get_response(app)
+    print('%-24s %10.1f req/s' % ('login throttled', rate(throttled)))
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(len(sorted_values) * fraction))]
+
+def measure(call, seconds=1.0):
+    """ Call ``call`` for ``seconds`` and return requests per second, p50
+    and p99 latency in microseconds, and memory blocks allocated and peak
+    bytes per call."""
+    timer = timeit.default_timer
+    timings = []
+    start = end = timer()
+    while end - start < seconds:
+        call()
+        now = timer()
+        timings.append(now - end)
+        end = now
+    timings.sort()
+    return {'rps': round(len(timings) / (end - start), 1),
+            'p50_us': round(percentile(timings, 0.5) * 1e6, 1),
+            'p99_us': round(percentile(timings, 0.99) * 1e6, 1),
+            'blocks': round(allocations(call)),
+            'bytes': round(peak_bytes(call))}
+
+# lower is better for all but rps
+MATRIX_FIELDS = (('rps', -1), ('p50_us', 1), ('p99_us', 1), ('blocks', 1),
+                 ('bytes', 1))
+
+@benchmark
+def matrix(baseline=None, tolerance=0.25, seconds=1.0):
+    """ Throughput, p50/p99 latency, blocks allocated and peak bytes per
+    request of the show, delete, login and logout requests against each
+    app*.py, loaded with apploader.  With ``baseline`` (a JSON file),
+    compare against it and exit with status 1 if any number is more than
+    ``tolerance`` worse, or write it if it does not exist yet."""
+    import glob
+    import json
+    import os
+    import shutil
+    import tempfile
+    from apploader import load_app
+    here = os.path.dirname(os.path.abspath(__file__))
+    tolerance = float(tolerance)
+    seconds = float(seconds)
+    def start_response(status, headers, exc_info=None):
+        pass
+    results = {}
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    # app7 keeps its revocation list in the current directory
+    os.chdir(tmpdir)
+    try:
+        for filename in sorted(glob.glob(os.path.join(here, 'app[0-9].py'))):
+            name = os.path.basename(filename)[:-3]
+            try:
+                app = load_app(filename)
+            except SyntaxError as e: # app2.py is Python 2 only
+                results[name] = {'skipped': 'SyntaxError: %s' % e.msg}
+                print('%-6s skipped (%s)' % (name, results[name]['skipped']))
+                continue
+            cookie = login_cookie(app, 'fred')
+            addresses = iter(range(10 ** 9))
+            def login():
+                # a new user and address every time, so app7's login
+                # throttle lets them all through
+                i = next(addresses)
+                return Request.blank(
+                    '/login?userid=user%d' % i, remote_addr='10.%d.%d.%d' % (
+                        i >> 16 & 255, (i >> 8) & 255, i & 255))
+            def with_cookie(path):
+                def request():
+                    request = Request.blank(path)
+                    if cookie:
+                        request.headers['Cookie'] = cookie
+                    return request
+                return request
+            scenarios = (('show', lambda: Request.blank('/blog/1')),
+                         ('delete', with_cookie('/blog/1/delete')),
+                         ('login', login),
+                         ('logout', with_cookie('/logout')))
+            results[name] = {}
+            for scenario, make_request in scenarios:
+                status = make_request().get_response(app).status_int
+                if status == 404:
+                    results[name][scenario] = {'skipped': 'no such route'}
+                    continue
+                if scenario == 'login':
+                    environ = None
+                else:
+                    environ = make_request().environ
+                def call():
+                    if environ is None:
+                        env = make_request().environ
+                    else:
+                        env = dict(environ)
+                    b''.join(app(env, start_response))
+                result = measure(call, seconds)
+                result['status'] = status
+                results[name][scenario] = result
+                print('%-6s %-7s %3d %10.1f req/s  p50 %8.1f us  p99 %8.1f us'
+                      '  %5d blocks  %8d bytes' % (
+                          name, scenario, status, result['rps'],
+                          result['p50_us'], result['p99_us'],
+                          result['blocks'], result['bytes']))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+    if baseline is None:
+        return
+    if not os.path.exists(baseline):
+        with open(baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results},
+                      f, indent=2, sort_keys=True)
+        print('wrote baseline %s' % baseline)
+        return
+    with open(baseline) as f:
+        old = json.load(f)['results']
+    regressions = 0
+    for name in sorted(results):
+        for scenario in sorted(results[name]):
+            new, was = results[name][scenario], old.get(name, {}).get(scenario)
+            if not isinstance(new, dict) or not isinstance(was, dict):
+                continue
+            for field, sign in MATRIX_FIELDS:
+                if field not in new or not was.get(field):
+                    continue
+                change = (new[field] - was[field]) / float(was[field])
+                if change * sign > tolerance:
+                    regressions += 1
+                    print('REGRESSION %s %s %s: %s -> %s (%+.0f%%)' % (
+                        name, scenario, field, was[field], new[field],
+                        change * 100))
+    if regressions:
+        sys.exit(1)
+    print('no regressions against %s' % baseline)
+
+def catalog(size):
+    """ ``size`` (path, acl) records like a blog catalog: every entry has
+    an ACL, one of about a thousand distinct ones."""
+    for i in range(size):
+        if i % 100:
+            acl = [['Allow', 'system.Authenticated', 'view']]
+        else:
+            acl = [['Allow', 'user%d' % (i % 100000 // 100), 'delete'],
+                   ['Allow', 'system.Authenticated', 'view']]
+        yield str(i), acl
+
+@benchmark
+def bulkload(size=5000000, mode=None):
+    """ Time and peak RSS of building an app7 tree of ``size`` blog
+    entries with bulkload.load from a generator and from a JSONL file, and
+    of add_subresource (for at most 20000 entries, as it is quadratic).
+    Each is run in its own process."""
+    import os
+    import resource
+    import subprocess
+    size = int(size)
+    if mode is None:
+        for mode in ('add_subresource', 'generator', 'jsonl'):
+            count = min(size, 20000) if mode == 'add_subresource' else size
+            subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                                   'bulkload', str(count), mode])
+        return
+    import json
+    import tempfile
+    import app7
+    import bulkload
+    timer = timeit.default_timer
+    if mode == 'jsonl':
+        filename = os.path.join(tempfile.mkdtemp(), 'catalog.jsonl')
+        with open(filename, 'w') as f:
+            for path, acl in catalog(size):
+                f.write(json.dumps({'path': path, 'acl': acl}) + '\n')
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = timer()
+    if mode == 'add_subresource':
+        root = app7.Resource('')
+        for path, acl in catalog(size):
+            root.add_subresource(path, acl=acl)
+        acls = len(set(id(child.__acl__) for child in root.children.values()))
+    else:
+        table = bulkload.ACLTable()
+        if mode == 'jsonl':
+            with open(filename) as f:
+                root = bulkload.load(bulkload.read_jsonl(f), acls=table)
+            os.remove(filename)
+            os.rmdir(os.path.dirname(filename))
+        else:
+            root = bulkload.load(catalog(size), acls=table)
+        acls = len(table)
+    elapsed = timer() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert len(root.children) == size
+    # ru_maxrss is in kilobytes on Linux
+    print('%-16s %8d entries %8.1f s %10.0f entries/s  peak RSS %7.1f MB'
+          ' (+%7.1f MB)  %d ACL tuples' % (
+              mode, size, elapsed, size / elapsed, peak / 1024.0,
+              (peak - before) / 1024.0, acls))
+
+def main(argv=sys.argv):
+    if len(argv) < 2 or argv[1] not in BENCHMARKS:
+        for name in sorted(BENCHMARKS):
+            summary = ' '.join(BENCHMARKS[name].__doc__.split())
+            print('%-12s %s' % (name, summary.split('. ')[0]))
+        return 1
+    BENCHMARKS[argv[1]](*argv[2:])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
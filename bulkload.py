@@ -0,0 +1,136 @@
+"""
+Build app7 resource trees from streams of (path, ACL) records.
+
+Calling ``add_subresource`` once per blog entry copies the parent's
+children dictionary every time (so that readers never see it change), which
+is quadratic for a big container, and every entry gets its own ACL tuple.
+``load`` builds a new tree from an iterable of records instead, without
+ever holding all of them::
+
+    with open('catalog.jsonl') as f:
+        root = bulkload.load(bulkload.read_jsonl(f), progress=report)
+    app7.root = root
+
+A record is a ``(path, acl)`` pair.  The path is ``/``-separated and
+relative to the root (``'1'`` or ``'2013/pycon/1'``); containers on the way
+that have no record of their own are created without an ACL, and a record
+for ``''`` sets the root's ACL.  The ACL is a list of ``(action,
+principal, permission)`` ACEs, as in ``__acl__``, or ``None``; in JSON,
+ACEs are lists and ``ALL_PERMISSIONS`` is written as
+``"__ALL_PERMISSIONS__"``, as in ``treestore`` files.  ``read_jsonl``
+reads one ``{"path": ..., "acl": ...}`` object per line; ``read_csv``
+reads ``path`` and ``acl`` columns, the ACL as JSON.
+
+Records are handled ``batch_size`` at a time: the new children of each
+parent in a batch are added to it with one ``dict.update``, and
+``progress(count)`` is called after each batch.  Identical ACLs share one
+tuple of tuples, so a catalog with a handful of distinct ACLs stores a
+handful of them.
+
+The tree is built in place, so build it under a root no request can see
+yet (the default, a new ``Resource``) and swap it in when it is done.
+"""
+import csv
+import json
+
+from pyramid.compat import is_nonstr_iter
+from pyramid.security import ALL_PERMISSIONS
+
+from app7 import NO_CHILDREN, Resource
+
+ALL = '__ALL_PERMISSIONS__'
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record['path'], record.get('acl')
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        acl = row.get('acl')
+        yield row['path'], json.loads(acl) if acl else None
+
+class ACLTable(object):
+    """ Hands out one shared tuple for each distinct ACL."""
+    def __init__(self):
+        self.acls = {}
+
+    def __call__(self, acl):
+        if acl is None:
+            return None
+        # ALL_PERMISSIONS is not hashable, so the key spells it as ALL
+        key = []
+        for action, principal, permission in acl:
+            if permission is ALL_PERMISSIONS:
+                permission = ALL
+            elif is_nonstr_iter(permission):
+                permission = tuple(permission)
+            key.append((action, principal, permission))
+        key = tuple(key)
+        shared = self.acls.get(key)
+        if shared is None:
+            shared = self.acls[key] = tuple(
+                (action, principal,
+                 ALL_PERMISSIONS if permission == ALL else permission)
+                for action, principal, permission in key)
+        return shared
+
+    def __len__(self):
+        return len(self.acls)
+
+def load(records, root=None, batch_size=10000, progress=None, acls=None):
+    """ Add ``records`` to ``root`` (by default a new ``Resource``) and
+    return it."""
+    if root is None:
+        root = Resource('')
+    if acls is None:
+        acls = ACLTable()
+    count = 0
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _add_batch(root, batch, acls)
+            count += len(batch)
+            batch = []
+            if progress is not None:
+                progress(count)
+    if batch:
+        _add_batch(root, batch, acls)
+        count += len(batch)
+        if progress is not None:
+            progress(count)
+    return root
+
+def _add_batch(root, batch, acls):
+    # parent -> the children this batch adds to it
+    added = {}
+    def child(parent, name):
+        node = parent.children.get(name)
+        if node is None:
+            siblings = added.get(parent)
+            if siblings is None:
+                siblings = added[parent] = {}
+            node = siblings.get(name)
+            if node is None:
+                node = siblings[name] = Resource(name, parent=parent)
+        return node
+    for path, acl in batch:
+        if '/' in path:
+            names = [name for name in path.split('/') if name]
+            parent = root
+            for name in names[:-1]:
+                parent = child(parent, name)
+            node = child(parent, names[-1]) if names else root
+        else:
+            # an entry directly below the root, the common case
+            node = child(root, path) if path else root
+        acl = acls(acl)
+        if acl is not None:
+            node.__acl__ = acl
+    for parent, siblings in added.items():
+        if parent.children is NO_CHILDREN:
+            parent.children = siblings
+        else:
+            parent.children.update(siblings)
@@ -0,0 +1,108 @@
+"""
+Request-scoped caching wrappers for authentication and authorization
+policies.
+
+Pyramid asks the authentication policy for the effective principals, and
+the authorization policy whether they are permitted, every time a permission
+is checked.  A view that checks several permissions, or renders many
+protected links, pays for reading the cookie and building the principals
+list again and again.  Wrapping the policies caches both answers for the
+lifetime of the request::
+
+    authn_policy = CachingAuthenticationPolicy(DumbAuthenticationPolicy())
+    authz_policy = CachingAuthorizationPolicy(DumbAuthorizationPolicy())
+
+The principals are computed once per request and returned as a frozenset,
+so ``Authenticated in principals`` is a hash lookup rather than a list scan.
+``permits`` results are memoized per (context, principals, permission).
+
+Each wrapper counts its ``hits`` and ``misses``.  The counters are not
+locked, so under threads they are approximate.
+"""
+from pyramid.threadlocal import get_current_request
+
+def _request_cache(request):
+    try:
+        return request._auth_cache
+    except AttributeError:
+        cache = request._auth_cache = {}
+        return cache
+
+class _Counting(object):
+    hits = 0
+    misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return total and float(self.hits) / total
+
+class CachingAuthenticationPolicy(_Counting):
+    """ Wrap an authentication policy, caching ``unauthenticated_userid``,
+    ``authenticated_userid`` and ``effective_principals`` on the request."""
+    def __init__(self, policy):
+        self.policy = policy
+
+    def _cached(self, request, name, compute):
+        cache = _request_cache(request)
+        try:
+            value = cache[name]
+        except KeyError:
+            self.misses += 1
+            value = cache[name] = compute(request)
+        else:
+            self.hits += 1
+        return value
+
+    def unauthenticated_userid(self, request):
+        return self._cached(request, 'unauthenticated_userid',
+                            self.policy.unauthenticated_userid)
+
+    def authenticated_userid(self, request):
+        return self._cached(request, 'authenticated_userid',
+                            self.policy.authenticated_userid)
+
+    def effective_principals(self, request):
+        return self._cached(
+            request, 'effective_principals',
+            lambda request: frozenset(
+                self.policy.effective_principals(request)))
+
+    def remember(self, request, principal, **kw):
+        _request_cache(request).clear()
+        return self.policy.remember(request, principal, **kw)
+
+    def forget(self, request):
+        _request_cache(request).clear()
+        return self.policy.forget(request)
+
+class CachingAuthorizationPolicy(_Counting):
+    """ Wrap an authorization policy, memoizing ``permits`` on the current
+    request.  Calls made outside of a request, or about an unhashable
+    context, are passed straight through."""
+    def __init__(self, policy):
+        self.policy = policy
+
+    def permits(self, context, principals, permission):
+        request = get_current_request()
+        if request is None:
+            return self.policy.permits(context, principals, permission)
+        if not isinstance(principals, frozenset):
+            principals = frozenset(principals)
+        try:
+            key = ('permits', context, principals, permission)
+            cache = _request_cache(request)
+            result = cache[key]
+        except KeyError:
+            self.misses += 1
+            result = cache[key] = self.policy.permits(
+                context, principals, permission)
+        except TypeError: # unhashable context
+            return self.policy.permits(context, principals, permission)
+        else:
+            self.hits += 1
+        return result
+
+    def principals_allowed_by_permission(self, context, permission):
+        return self.policy.principals_allowed_by_permission(
+            context, permission)
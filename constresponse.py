@@ -0,0 +1,69 @@
+"""
+Preallocated responses for constant bodies, and streamed responses for big
+ones.
+
+``Response('Shown')`` builds a new response object, a new header list and a
+new encoded body on every request.  A ``ConstantResponse`` is built once,
+with its status line, headers and encoded body worked out up front, and the
+same instance is returned by every call of the view::
+
+    SHOWN = ConstantResponse('Shown')
+
+    @view_config(route_name='blogentry_show')
+    def show(self):
+        return SHOWN
+
+When the server calls it, it passes its status and a copy of its header
+list to ``start_response`` (WSGI servers insist on a list) and returns a
+tuple holding the body, which the server writes as is.
+
+Because one instance is shared by all requests, it cannot be changed:
+``headerlist`` is a tuple, so a response callback or ``NewResponse``
+subscriber that tries to add a header (e.g. ``AuthTktAuthenticationPolicy``
+with a ``reissue_time``) fails loudly instead of leaking the header into
+other requests.  Views whose responses get modified like that should keep
+returning a ``Response``.
+
+``stream_response`` is for the other end of the scale: a body too big to
+build in memory, produced piece by piece by an iterable of bytes.
+"""
+from pyramid.interfaces import IResponse
+from pyramid.response import Response
+from zope.interface import implementer
+
+@implementer(IResponse)
+class ConstantResponse(object):
+    __slots__ = ('status', 'status_int', 'headerlist', 'body', 'app_iter')
+
+    def __init__(self, body, status='200 OK', content_type='text/html',
+                 charset='UTF-8', headers=()):
+        if not isinstance(body, bytes):
+            body = body.encode(charset)
+        self.status = status
+        self.status_int = int(status.split(' ', 1)[0])
+        if charset:
+            content_type = '%s; charset=%s' % (content_type, charset)
+        self.headerlist = (
+            ('Content-Type', content_type),
+            ('Content-Length', str(len(body))),
+            ) + tuple(headers)
+        self.body = body
+        self.app_iter = (body,)
+
+    def __call__(self, environ, start_response):
+        start_response(self.status, list(self.headerlist))
+        return self.app_iter
+
+    def __repr__(self):
+        return '<ConstantResponse %s %r>' % (self.status, self.body[:20])
+
+def stream_response(chunks, content_type='text/html', charset='UTF-8',
+                    content_length=None, **kw):
+    """ Return a ``Response`` whose body is the iterable of byte strings
+    ``chunks``, written out as it is produced.  Without a
+    ``content_length`` the server sends it chunked."""
+    response = Response(app_iter=chunks, content_type=content_type,
+                        charset=charset, **kw)
+    if content_length is not None:
+        response.content_length = content_length
+    return response
@@ -26,6 +26,7 @@ if __name__ == '__main__':
     config = Configurator()
     config.add_route('set', '/set')
     config.add_route('show', '/show')
+    config.include('lazycookies')
     config.scan()
     app = config.make_wsgi_app()
     serve(app)
@@ -0,0 +1,78 @@
+"""
+Nested group membership for authentication policy callbacks.
+
+Principals like ``group:admins`` have to come from somewhere.  A
+``GroupGraph`` records which principals (users or groups) are direct members
+of which groups, and its ``groupfinder`` is a callback for
+``AuthTktAuthenticationPolicy`` (or any policy based on
+``CallbackAuthenticationPolicy``) that returns every group a user belongs
+to, directly or through other groups::
+
+    graph = GroupGraph()
+    graph.add('fred', 'group:editors')
+    graph.add('group:editors', 'group:staff')
+    authn_policy = AuthTktAuthenticationPolicy(
+        'soseekrit', callback=graph.groupfinder)
+
+    # fred's effective principals now include group:editors and group:staff
+
+The transitive closure of each principal is computed once and cached.  The
+graph also remembers which cached closures include each group, so adding or
+removing a membership only throws away the closures that went through it.
+Cycles are allowed.
+"""
+import threading
+from collections import defaultdict
+
+class GroupGraph(object):
+    def __init__(self):
+        self.parents = defaultdict(set)
+        self.closures = {}
+        # principal -> principals whose cached closure goes through it
+        self.dependents = defaultdict(set)
+        self.lock = threading.RLock()
+
+    def add(self, member, group):
+        """ Make ``member`` (a userid or group) a direct member of
+        ``group``."""
+        with self.lock:
+            self.parents[member].add(group)
+            self._invalidate(member)
+
+    def remove(self, member, group):
+        with self.lock:
+            self.parents[member].discard(group)
+            self._invalidate(member)
+
+    def _invalidate(self, member):
+        for principal in self.dependents.pop(member, ()):
+            self.closures.pop(principal, None)
+        self.closures.pop(member, None)
+
+    def groups(self, principal):
+        """ Return a frozenset of every group ``principal`` belongs to."""
+        closure = self.closures.get(principal)
+        if closure is not None:
+            return closure
+        with self.lock:
+            closure = set()
+            stack = list(self.parents.get(principal, ()))
+            while stack:
+                group = stack.pop()
+                if group in closure:
+                    continue
+                closure.add(group)
+                cached = self.closures.get(group)
+                if cached is not None:
+                    closure.update(cached)
+                else:
+                    stack.extend(self.parents.get(group, ()))
+            closure.discard(principal)
+            closure = self.closures[principal] = frozenset(closure)
+            self.dependents[principal].add(principal)
+            for group in closure:
+                self.dependents[group].add(principal)
+        return closure
+
+    def groupfinder(self, userid, request):
+        return self.groups(userid)
@@ -0,0 +1,126 @@
+"""
+A ``request.cookies`` that only looks for the cookies it is asked for.
+
+``request.cookies.get('userid')`` makes WebOb parse the whole ``Cookie``
+header into a dictionary, decoding every name and value, even though the
+browser sent dozens of cookies the application never reads.  ``LazyCookies``
+answers ``get``, ``[]`` and ``in`` by searching the header for just the
+requested name, and remembers what it found.  Anything that needs all of
+them (iterating, ``len``, ``items``, changing a cookie) goes to WebOb's own
+``RequestCookies``, so it behaves exactly as before.
+
+The search is only used for plain headers (``a=1; b=2``) made of the
+characters WebOb accepts in unquoted names and values.  A header with
+quoted values, escapes, spaces around ``=`` or anything else unusual is
+parsed the WebOb way, so the answers are always the same as WebOb's,
+including "the last of several cookies with the same name wins".
+
+To make it the request's ``cookies``::
+
+    config.include('lazycookies')
+
+which sets ``LazyCookiesRequest``, a ``Request`` whose ``cookies`` is a
+``LazyCookies``, as the request factory.  (``add_request_method`` with
+``reify=True`` would do the same, but Pyramid then makes a new request class
+for every request, which costs more than parsing a short header.)  An
+application with its own request factory can subclass it instead.
+"""
+import re
+
+try:
+    from collections.abc import MutableMapping
+except ImportError: # Python 2
+    from collections import MutableMapping
+
+from pyramid.decorator import reify
+from pyramid.request import Request
+from webob.cookies import RequestCookies
+
+# the characters WebOb accepts unquoted, plus the '; ' between cookies
+_not_plain = re.compile(r"[^A-Za-z0-9_~!@#$%^&*()+=\-`.?|:/{}<>'; ]")
+# names WebOb ignores or treats specially; asking for them goes to WebOb
+_plain_name = re.compile(
+    r"[A-Za-z0-9!#%&'*+\-.^_`|~][A-Za-z0-9!#$%&'*+\-.^_`|~]*$")
+_attributes = frozenset(('comment', 'domain', 'expires', 'httponly',
+                         'max-age', 'path', 'samesite', 'secure'))
+
+_missing = object()
+
+class LazyCookies(MutableMapping):
+    def __init__(self, environ):
+        self.environ = environ
+        self.header = environ.get('HTTP_COOKIE', '')
+        self.found = {}
+        self.plain = not (_not_plain.search(self.header) or
+                          ' =' in self.header or '= ' in self.header)
+
+    @property
+    def all(self):
+        return RequestCookies(self.environ)
+
+    def _find(self, name):
+        header = self.environ.get('HTTP_COOKIE', '')
+        if header != self.header:
+            self.__init__(self.environ)
+            header = self.header
+        if (not self.plain or not _plain_name.match(name) or
+                name.lower() in _attributes):
+            return self.all.get(name, _missing)
+        value = self.found.get(name)
+        if value is not None:
+            return value
+        key = name + '='
+        end = len(header)
+        while True:
+            start = header.rfind(key, 0, end)
+            if start < 0:
+                value = _missing
+                break
+            if start == 0 or header[start - 1] in '; ':
+                start += len(key)
+                stop = start
+                while stop < len(header) and header[stop] not in '; ':
+                    stop += 1
+                value = header[start:stop]
+                if isinstance(value, bytes): # Python 2
+                    value = value.decode('utf-8')
+                break
+            end = start
+        self.found[name] = value
+        return value
+
+    def get(self, name, default=None):
+        value = self._find(name)
+        return default if value is _missing else value
+
+    def __getitem__(self, name):
+        value = self._find(name)
+        if value is _missing:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self._find(name) is not _missing
+
+    def __setitem__(self, name, value):
+        self.all[name] = value
+
+    def __delitem__(self, name):
+        del self.all[name]
+
+    def __iter__(self):
+        return iter(self.all)
+
+    def __len__(self):
+        return len(self.all)
+
+    def __repr__(self):
+        return '<LazyCookies: %r>' % self.header
+
+class LazyCookiesRequest(Request):
+    @reify
+    def cookies(self):
+        return LazyCookies(self.environ)
+
+def includeme(config):
+    config.set_request_factory(LazyCookiesRequest)
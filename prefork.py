@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+A prefork launcher for the app*.py applications.
+
+``serve(app)`` runs one process, so the GIL limits how much CPU ticket
+hashing and ACL checks can use.  This launcher builds the application once
+in a parent process (including app7's shared resource tree and the policy
+objects), binds one listening socket, and forks ``--workers`` waitress
+processes that all accept from it::
+
+    python prefork.py app7.py --port 6543 --workers 4
+
+Because everything is built before forking, workers share those pages
+copy-on-write; ``gc.freeze()`` (Python 3.7+) keeps the garbage collector
+from touching, and so copying, them.
+
+The parent restarts workers that die; one that dies within a second of
+starting is restarted after a delay that doubles, up to 30 seconds, each
+time that happens in a row, so a worker that cannot start does not spin.
+Send the parent ``SIGHUP`` for a rolling reload: it loads the script again
+and replaces the workers one at a time, starting each new worker before
+stopping an old one, so the socket is never left without a worker.
+
+A worker sent ``SIGTERM`` stops accepting connections, closes its idle
+keep-alive connections, and exits once the requests it has already read
+are answered.  The parent gives it ``--timeout`` seconds to do that and
+then kills it with ``SIGKILL``.  ``SIGTERM`` or ``SIGINT`` to the parent
+stops every worker that way, all at once.  This needs a Unix ``fork``.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import waitress
+from waitress import wasyncore
+from waitress.channel import HTTPChannel
+
+from apploader import load_app
+
+def _exit(signum, frame):
+    sys.exit(0)
+
+class Worker(object):
+    """ A waitress server for ``app`` on ``sock`` that drains on
+    ``SIGTERM``."""
+    def __init__(self, app, sock, threads=4):
+        self.server = waitress.create_server(app, sockets=[sock],
+                                             threads=threads)
+        self.stopping = False
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def poll(self, timeout):
+        wasyncore.loop(timeout=timeout, map=self.server._map, count=1)
+
+    def run(self):
+        server = self.server
+        while not self.stopping:
+            self.poll(server.adj.asyncore_loop_timeout)
+        # the server's readable() is false from now on, so it no longer
+        # accepts; the other workers take the new connections
+        server.accepting = False
+        while True:
+            channels = [channel for channel in list(server._map.values())
+                        if isinstance(channel, HTTPChannel)]
+            if not channels:
+                break
+            for channel in channels:
+                if not channel.requests and channel.request is None:
+                    # idle keep-alive, or its last response is being sent
+                    channel.close_when_flushed = True
+            self.poll(0.1)
+        server.task_dispatcher.shutdown()
+
+class Arbiter(object):
+    """ Keep ``workers`` worker processes serving ``filename`` on
+    ``sock``."""
+    min_uptime = 1.0
+    max_backoff = 30.0
+
+    def __init__(self, filename, sock, workers=4, threads=4, timeout=30.0):
+        self.filename = filename
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.timeout = timeout
+        self.pids = set()
+        self.started = {}
+        self.backoff = 0
+        self.respawns = []
+        self.reloading = False
+        self.stopping = False
+
+    def load(self):
+        self.app = load_app(self.filename)
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            self.started[pid] = time.time()
+            return pid
+        try:
+            for signum in (signal.SIGHUP, signal.SIGINT):
+                signal.signal(signum, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, _exit)
+            worker = Worker(self.app, self.sock, threads=self.threads)
+            signal.signal(signal.SIGTERM, worker.stop)
+            worker.run()
+        finally:
+            os._exit(0)
+
+    def stop(self, *pids):
+        """ Send workers ``pids`` ``SIGTERM``, kill those still running
+        ``timeout`` seconds later, and wait for them all to exit."""
+        running = set()
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                running.add(pid)
+            except OSError:
+                pass
+        deadline = time.time() + self.timeout
+        while running:
+            for pid in list(running):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        running.discard(pid)
+                except OSError: # already reaped
+                    running.discard(pid)
+            if running and time.time() >= deadline:
+                for pid in running:
+                    sys.stderr.write('worker %d did not stop within %gs; '
+                                     'killing it\n' % (pid, self.timeout))
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                        os.waitpid(pid, 0)
+                    except OSError:
+                        pass
+                break
+            time.sleep(0.05)
+        for pid in pids:
+            self.pids.discard(pid)
+            self.started.pop(pid, None)
+
+    def exited(self, pid, status):
+        """ Schedule a worker to replace ``pid``, later if it died young."""
+        self.pids.discard(pid)
+        uptime = time.time() - self.started.pop(pid)
+        if uptime < self.min_uptime:
+            self.backoff = min(max(self.backoff * 2, 0.1), self.max_backoff)
+        else:
+            self.backoff = 0
+        sys.stderr.write('worker %d exited with status %d; restarting in '
+                         '%.1fs\n' % (pid, status, self.backoff))
+        self.respawns.append(time.time() + self.backoff)
+
+    def reload(self, signum=None, frame=None):
+        self.reloading = True
+
+    def shutdown(self, signum=None, frame=None):
+        self.stopping = True
+
+    def rolling_reload(self):
+        self.reloading = False
+        old = list(self.pids)
+        self.load()
+        for pid in old:
+            self.spawn()
+            self.stop(pid)
+
+    def run(self):
+        self.load()
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGTERM, self.shutdown)
+        signal.signal(signal.SIGINT, self.shutdown)
+        for i in range(self.workers):
+            self.spawn()
+        while not self.stopping:
+            if self.reloading:
+                self.rolling_reload()
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError: # no children; e.g. interrupted by a signal
+                pid = 0
+            if pid in self.pids:
+                if not self.stopping:
+                    self.exited(pid, status)
+                else:
+                    self.pids.discard(pid)
+            now = time.time()
+            for when in [when for when in self.respawns if when <= now]:
+                self.respawns.remove(when)
+                self.spawn()
+            if not pid:
+                time.sleep(0.2)
+        self.stop(*self.pids)
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('filename', help='an app*.py script')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=6543)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds a stopping worker gets to drain')
+    args = parser.parse_args(argv[1:])
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sys.stderr.write('Serving %s on http://%s:%d with %d workers\n' % (
+        args.filename, args.host, args.port, args.workers))
+    Arbiter(args.filename, sock, workers=args.workers,
+            threads=args.threads, timeout=args.timeout).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Revoke remembered tickets on the server, in every worker.
+
+``forget`` only asks the browser to drop its cookie.  Anyone who copied the
+cookie before the user logged out can keep using it until it times out.
+``RevokingAuthenticationPolicy`` wraps a cookie-based authentication policy
+so that ``forget`` also records the cookie's value in a ``RevocationList``,
+and a request presenting a revoked cookie is treated as unauthenticated::
+
+    revocations = RevocationList('revoked.db')
+    authn_policy = RevokingAuthenticationPolicy(
+        AuthTktAuthenticationPolicy('soseekrit', timeout=86400),
+        revocations)
+
+The revocation list is an SQLite table that every worker process shares.
+Each process keeps an in-memory set of (hashes of) revoked cookies, so the
+check made on each authenticated request is a set lookup, and the set is
+empty until someone logs out.  At most every ``refresh_interval`` seconds a
+request reads the revocations added since the last time it looked (by row
+id, so only new rows are read), so a logout in one worker takes effect in
+all of them within ``refresh_interval`` seconds; in the worker that handled
+the logout it takes effect at once.  A plain set is used rather than a Bloom
+filter: only cookies that were really revoked are in it, so it stays small,
+and it has no false positives to double check.
+
+A cookie can be spelled several ways that ``AuthTktAuthenticationPolicy``
+reads as the same ticket (the timestamp's hex digits in either case, the
+userid URL-quoted or not, the whole value in double quotes), so for an
+``auth_tkt`` cookie what is revoked is the ticket's digest, which the policy
+compares exactly, not the cookie as sent.  Run ``python revocation.py`` to
+check that a revoked ticket is refused however it is spelled.
+
+A revocation only needs to outlast the cookie, so it is kept for ``keep``
+seconds, by default the wrapped policy's ``timeout``, and expired rows are
+deleted in batches.  A policy without a ``timeout`` issues tickets that
+never expire, so its revocations are kept forever (``expires`` is NULL).
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from pyramid.security import Everyone
+
+NEVER = float('inf')
+
+def token_hash(token):
+    if not isinstance(token, bytes):
+        token = token.encode('utf-8')
+    return hashlib.sha1(token).hexdigest()
+
+class RevocationList(object):
+    """ Revoked tokens in an SQLite file shared between processes, mirrored
+    into an in-memory set in each process."""
+    def __init__(self, filename, refresh_interval=1.0, sweep_interval=60,
+                 sweep_batch=1000):
+        self.filename = filename
+        self.refresh_interval = refresh_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.revoked = {} # token hash -> expires
+        self.last_id = 0
+        self.next_refresh = 0
+        self.next_sweep = time.time() + sweep_interval
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        conn = self.connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        # AUTOINCREMENT so that ids are never reused after a sweep
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS revoked ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT,'
+            ' expires REAL)')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS revoked_expires ON revoked (expires)')
+        self.refresh()
+
+    def connection(self):
+        # one connection per thread, and a new one after a fork (prefork.py
+        # builds the app before forking its workers)
+        conn, pid = getattr(self.local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=10,
+                                   isolation_level=None)
+            self.local.conn = conn, os.getpid()
+        return conn
+
+    def revoke(self, token, max_age=None):
+        """ Revoke ``token`` (e.g. a cookie value) for ``max_age``
+        seconds, or for good if ``max_age`` is None."""
+        key = token_hash(token)
+        expires = None if max_age is None else time.time() + max_age
+        self.connection().execute(
+            'INSERT INTO revoked (token, expires) VALUES (?, ?)',
+            (key, expires))
+        if expires is None:
+            expires = NEVER
+        with self.lock:
+            self.revoked[key] = max(expires, self.revoked.get(key, 0))
+
+    def is_revoked(self, token):
+        now = time.time()
+        if now >= self.next_refresh and self.lock.acquire(False):
+            # one thread refreshes; the others use the set as it is
+            try:
+                self._refresh(now)
+            finally:
+                self.lock.release()
+        revoked = self.revoked
+        if not revoked:
+            return False
+        expires = revoked.get(token_hash(token))
+        return expires is not None and expires > now
+
+    def refresh(self):
+        """ Read the revocations other processes have added, now."""
+        with self.lock:
+            self._refresh(time.time())
+
+    def _refresh(self, now):
+        self.next_refresh = now + self.refresh_interval
+        conn = self.connection()
+        rows = conn.execute(
+            'SELECT id, token, expires FROM revoked'
+            ' WHERE id > ? AND (expires IS NULL OR expires > ?) ORDER BY id',
+            (self.last_id, now)).fetchall()
+        if rows:
+            revoked = dict(self.revoked)
+            for row_id, key, expires in rows:
+                if expires is None:
+                    expires = NEVER
+                revoked[key] = max(expires, revoked.get(key, 0))
+            self.last_id = rows[-1][0]
+            self.revoked = revoked
+        if now >= self.next_sweep:
+            # rows revoked for good have a NULL expires, which never matches
+            self.next_sweep = now + self.sweep_interval
+            conn.execute(
+                'DELETE FROM revoked WHERE id IN'
+                ' (SELECT id FROM revoked WHERE expires <= ? LIMIT ?)',
+                (now, self.sweep_batch))
+            self.revoked = dict((key, expires) for key, expires
+                                in self.revoked.items() if expires > now)
+
+class RevokingAuthenticationPolicy(object):
+    """ Wrap a cookie-based authentication policy so that ``forget``
+    revokes the request's cookie (or its ticket's digest, see above) in
+    ``revocations``.  ``cookie_name`` and
+    ``keep`` default to the wrapped policy's cookie name and ``timeout``;
+    with neither a ``keep`` nor a ``timeout``, revocations never expire."""
+    def __init__(self, policy, revocations, cookie_name=None, keep=None):
+        self.policy = policy
+        self.revocations = revocations
+        cookie = getattr(policy, 'cookie', policy)
+        if cookie_name is None:
+            cookie_name = cookie.cookie_name
+        if keep is None:
+            keep = getattr(cookie, 'timeout', None)
+        self.cookie_name = cookie_name
+        self.keep = keep
+        hashalg = getattr(cookie, 'hashalg', None)
+        if hashalg is None:
+            self.digest_size = None
+        else:
+            self.digest_size = hashlib.new(hashalg).digest_size * 2
+
+    def _token(self, request):
+        token = request.cookies.get(self.cookie_name)
+        if token and self.digest_size is not None:
+            # as parse_ticket reads it
+            token = token.strip('"')[:self.digest_size]
+        return token
+
+    def _revoked(self, request):
+        # asked up to three times per request; look the cookie up once
+        token = self._token(request)
+        checked = getattr(request, '_revocation_checked', None)
+        if checked is not None and checked[0] == token:
+            return checked[1]
+        revoked = token is not None and self.revocations.is_revoked(token)
+        request._revocation_checked = token, revoked
+        return revoked
+
+    def unauthenticated_userid(self, request):
+        if self._revoked(request):
+            return None
+        return self.policy.unauthenticated_userid(request)
+
+    def authenticated_userid(self, request):
+        if self._revoked(request):
+            return None
+        return self.policy.authenticated_userid(request)
+
+    def effective_principals(self, request):
+        if self._revoked(request):
+            return [Everyone]
+        return self.policy.effective_principals(request)
+
+    def remember(self, request, principal, **kw):
+        return self.policy.remember(request, principal, **kw)
+
+    def forget(self, request):
+        token = self._token(request)
+        if token:
+            self.revocations.revoke(token, self.keep)
+            request._revocation_checked = None
+        return self.policy.forget(request)
+
+def selfcheck():
+    """ Log in to app7, log out, and check that the ticket is refused as
+    sent and re-spelled.  Raise ``AssertionError`` if it is accepted."""
+    import shutil
+    import tempfile
+    from pyramid.authentication import AuthTktAuthenticationPolicy
+    from webob import Request
+    from bench import make_app7
+    tmpdir = tempfile.mkdtemp()
+    try:
+        policy = AuthTktAuthenticationPolicy('soseekrit')
+        app = make_app7(authentication_policy=RevokingAuthenticationPolicy(
+            policy, RevocationList(os.path.join(tmpdir, 'revoked.db'))))
+        response = Request.blank('/login?userid=joe').get_response(app)
+        ticket = response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+        size = hashlib.new(policy.cookie.hashalg).digest_size * 2
+        spellings = [
+            ticket,
+            ticket[:size] + ticket[size:size + 8].upper() + ticket[size + 8:],
+            '"%s"' % ticket,
+            ticket[:size + 8] + ticket[size + 8:].replace('joe', '%6Aoe', 1),
+            ]
+        def status(value):
+            request = Request.blank('/blog/1/delete')
+            request.headers['Cookie'] = 'auth_tkt=' + value
+            return request.get_response(app).status_int
+        for value in spellings:
+            assert status(value) == 200, value
+        request = Request.blank('/logout')
+        request.headers['Cookie'] = 'auth_tkt=' + ticket
+        request.get_response(app)
+        for value in spellings:
+            assert status(value) == 403, value
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    selfcheck()
+    print('revoked tickets are refused however they are spelled')
@@ -0,0 +1,116 @@
+"""
+A routes mapper that only tries the routes that can match a path's leading
+segments.
+
+Pyramid's ``RoutesMapper`` tries every route's regular expression, in
+registration order, until one matches, so dispatch gets slower with every
+``add_route``.  ``PrefixRoutesMapper`` keeps the routes in a trie keyed by
+the literal segments their pattern starts with (``blog`` for
+``/blog/{id}/delete``, ``blog``, ``archive`` for ``/blog/archive/{year}``).
+Routes whose first segment has a placeholder or star (``/{id}``,
+``/*traverse``) can match anything and are tried for every path.  For a
+path, it walks the trie as far as the path's segments go and tries the
+routes whose literal segments are a prefix of the path, together with those
+wildcard routes, in registration order, so the route found (and its
+predicates, including the ``traverse`` path that ``add_route(traverse=...)``
+builds) is exactly the one the stock mapper would find.
+
+Routes that share all of their literal segments (``/blog/{id}`` and
+``/blog/{id}/delete``) still sit in one trie node, and are tried one after
+another like the stock mapper does; so are the wildcard routes.
+
+It is opt in; call ``use_prefix_router`` before adding routes::
+
+    config = Configurator(...)
+    use_prefix_router(config)
+    config.add_route('blogentry_show', '/blog/{id}')
+"""
+from pyramid.compat import decode_path_info
+from pyramid.exceptions import ConfigurationError, URLDecodeError
+from pyramid.interfaces import IRoutesMapper
+from pyramid.urldispatch import RoutesMapper
+
+def literal_segments(pattern):
+    """ Return the segments a route pattern starts with up to the first one
+    that contains a placeholder or star, as a tuple."""
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    segments = []
+    for segment in pattern.split('/'):
+        if '{' in segment or ':' in segment or '*' in segment:
+            break
+        segments.append(segment)
+    return tuple(segments)
+
+class PrefixRoutesMapper(RoutesMapper):
+    def __init__(self):
+        RoutesMapper.__init__(self)
+        self._trie = None
+
+    def connect(self, *arg, **kw):
+        route = RoutesMapper.connect(self, *arg, **kw)
+        self._trie = None
+        return route
+
+    def _build_trie(self):
+        # a node is [children, routes]; routes is None for a node no
+        # route's literal segments end at, which tries its parent's routes
+        root = [{}, []]
+        for position, route in enumerate(self.routelist):
+            node = root
+            for segment in literal_segments(route.pattern):
+                node = node[0].setdefault(segment, [{}, None])
+            if node[1] is None:
+                node[1] = []
+            node[1].append((position, route))
+        def freeze(node, inherited):
+            children, routes = node
+            if routes is not None:
+                inherited = sorted(inherited + routes, key=lambda x: x[0])
+                routes = tuple(route for position, route in inherited)
+            return ({segment: freeze(child, inherited)
+                     for segment, child in children.items()}, routes)
+        self._trie = freeze(root, [])
+        return self._trie
+
+    def __call__(self, request):
+        environ = request.environ
+        try:
+            # empty if mounted under a path in mod_wsgi, for example
+            path = decode_path_info(environ['PATH_INFO'] or '/')
+        except KeyError:
+            path = '/'
+        except UnicodeDecodeError as e:
+            raise URLDecodeError(e.encoding, e.object, e.start, e.end,
+                                 e.reason)
+        children, routes = self._trie or self._build_trie()
+        for segment in path[1:].split('/'):
+            node = children.get(segment)
+            if node is None:
+                break
+            children, found = node
+            if found is not None:
+                routes = found
+        for route in routes:
+            match = route.match(path)
+            if match is not None:
+                preds = route.predicates
+                info = {'match': match, 'route': route}
+                if preds and not all((p(info, request) for p in preds)):
+                    continue
+                return info
+        return {'route': None, 'match': None}
+
+def use_prefix_router(config):
+    """ Make ``config`` dispatch URLs with a ``PrefixRoutesMapper``.
+
+    ``add_route`` binds each route to the mapper registered when it is
+    called, so routes added before this would stay with the old mapper and
+    never be dispatched; a ``ConfigurationError`` is raised instead if a
+    mapper is already registered."""
+    if config.registry.queryUtility(IRoutesMapper) is not None:
+        raise ConfigurationError(
+            'use_prefix_router must be called before any add_route')
+    mapper = PrefixRoutesMapper()
+    config.registry.registerUtility(mapper, IRoutesMapper)
+    return mapper
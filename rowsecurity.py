@@ -0,0 +1,200 @@
+"""
+Permission filters for listings, evaluated by SQLite.
+
+app7's resources answer "may these principals do this?" one resource at a
+time, so listing "the entries fred may delete" means loading every entry
+into Python and asking ``ACLAuthorizationPolicy`` about each.  An
+``EntryStore`` keeps blog entries and their ACLs in SQLite and turns the
+same question into an SQL condition, so filtering, counting and paging
+happen in the database::
+
+    store = EntryStore(root, 'blog.db')
+    store.add('1', acl=[(Allow, Authenticated, 'delete')])
+    page = store.entries(['fred', Authenticated, Everyone], 'delete',
+                         limit=20)
+    next_page = store.entries(principals, 'delete', limit=20,
+                              after=page[-1][0])
+
+The entries are the children of ``container`` (app7's root).  Each ACE is a
+row of the ``aces`` table (one per permission when an ACE names several;
+``ALL_PERMISSIONS`` is stored as NULL).  As in ``ACLAuthorizationPolicy``,
+an entry's first ACE naming one of the principals and the permission
+decides; the condition finds, through an index on (principal,
+permission), the entries whose first such ACE allows (or denies).  Entries
+without a matching ACE inherit the container's decision, which does not
+depend on the entry, so it is computed once, in Python, by the stock policy
+and picks which of the two conditions is used.
+
+Run ``python rowsecurity.py`` to compare the listings with the stock
+policy's decision for every entry of randomly generated stores.
+"""
+import random
+import sqlite3
+import sys
+
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.compat import is_nonstr_iter
+from pyramid.security import ALL_PERMISSIONS, Allow, Deny
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+  id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS aces (
+  entry_id INTEGER NOT NULL, position INTEGER NOT NULL,
+  allow INTEGER NOT NULL, principal TEXT NOT NULL, permission TEXT);
+CREATE INDEX IF NOT EXISTS aces_match ON aces (principal, permission);
+CREATE INDEX IF NOT EXISTS aces_entry ON aces (entry_id, position);
+"""
+
+def _ace_rows(entry_id, acl):
+    for position, (action, principal, permissions) in enumerate(acl or ()):
+        allow = int(action == Allow)
+        if permissions is ALL_PERMISSIONS:
+            yield entry_id, position, allow, principal, None
+            continue
+        if not is_nonstr_iter(permissions):
+            permissions = [permissions]
+        for permission in permissions:
+            yield entry_id, position, allow, principal, permission
+
+class EntryStore(object):
+    """ Blog entries below ``container`` with their ACLs, in SQLite."""
+    def __init__(self, container, filename=':memory:'):
+        self.container = container
+        self.policy = ACLAuthorizationPolicy()
+        self.conn = sqlite3.connect(filename, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def add(self, name, acl=None):
+        self.add_many([(name, acl)])
+
+    def add_many(self, entries):
+        """ Add ``(name, acl)`` pairs in one transaction."""
+        conn = self.conn
+        with conn:
+            conn.execute('BEGIN')
+            for name, acl in entries:
+                entry_id = conn.execute(
+                    'INSERT INTO entries (name) VALUES (?)', (name,)
+                    ).lastrowid
+                conn.executemany('INSERT INTO aces VALUES (?, ?, ?, ?, ?)',
+                                 _ace_rows(entry_id, acl))
+
+    def set_acl(self, name, acl):
+        conn = self.conn
+        with conn:
+            conn.execute('BEGIN')
+            entry_id, = conn.execute('SELECT id FROM entries WHERE name = ?',
+                                     (name,)).fetchone()
+            conn.execute('DELETE FROM aces WHERE entry_id = ?', (entry_id,))
+            conn.executemany('INSERT INTO aces VALUES (?, ?, ?, ?, ?)',
+                             _ace_rows(entry_id, acl))
+
+    def acl(self, entry_id):
+        """ Rebuild an entry's ACL from its rows."""
+        acl = []
+        last = None
+        for position, allow, principal, permission in self.conn.execute(
+                'SELECT position, allow, principal, permission FROM aces'
+                ' WHERE entry_id = ? ORDER BY position', (entry_id,)):
+            action = Allow if allow else Deny
+            if permission is None:
+                permission = ALL_PERMISSIONS
+            if position == last:
+                permissions = acl[-1][2]
+                if not isinstance(permissions, tuple):
+                    permissions = (permissions,)
+                acl[-1] = (action, principal, permissions + (permission,))
+            else:
+                acl.append((action, principal, permission))
+            last = position
+        return acl
+
+    def resource(self, name):
+        """ Load an entry as an app7 ``Resource`` below the container."""
+        from app7 import Resource
+        entry_id, = self.conn.execute('SELECT id FROM entries WHERE name = ?',
+                                      (name,)).fetchone()
+        return Resource(name, acl=self.acl(entry_id), parent=self.container)
+
+    def condition(self, principals, permission):
+        """ Return an SQL condition on ``entries`` that holds for the
+        entries ``principals`` have ``permission`` on, and its parameters."""
+        principals = list(set(principals))
+        def match(alias):
+            return ('%s.principal IN (%s) AND'
+                    ' (%s.permission = ? OR %s.permission IS NULL)' % (
+                        alias, ', '.join('?' * len(principals)), alias,
+                        alias))
+        params = principals + [permission]
+        # entries whose first matching ACE is an Allow (or a Deny)
+        decided = ('SELECT a.entry_id FROM aces a WHERE %s AND a.allow = ?'
+                   ' AND NOT EXISTS (SELECT 1 FROM aces b'
+                   ' WHERE b.entry_id = a.entry_id'
+                   ' AND b.position < a.position AND %s)' % (
+                       match('a'), match('b')))
+        if self.policy.permits(self.container, principals, permission):
+            return 'entries.id NOT IN (%s)' % decided, params + [0] + params
+        return 'entries.id IN (%s)' % decided, params + [1] + params
+
+    def entries(self, principals, permission, limit=None, after=None):
+        """ Return ``(id, name)`` of the entries ``principals`` have
+        ``permission`` on, in id order, at most ``limit`` of them, starting
+        after the entry with id ``after``."""
+        condition, params = self.condition(principals, permission)
+        sql = 'SELECT id, name FROM entries WHERE ' + condition
+        if after is not None:
+            sql += ' AND id > ?'
+            params.append(after)
+        sql += ' ORDER BY id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def count(self, principals, permission):
+        condition, params = self.condition(principals, permission)
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM entries WHERE ' + condition,
+            params).fetchone()[0]
+
+def selfcheck(trials=100, size=200, seed=None):
+    """ Fill ``trials`` stores with ``size`` entries with random ACLs under
+    a root with a random ACL, and check that paging through ``entries``
+    returns exactly the entries the stock policy allows.  Raise
+    ``AssertionError`` on the first difference."""
+    from pyramid.security import Authenticated, Everyone
+    from app7 import Resource
+    rng = random.Random(seed)
+    principals = ['fred', 'joe', 'group:admins', Authenticated, Everyone]
+    permissions = ['view', 'edit', 'delete']
+    def random_acl():
+        return [(rng.choice([Allow, Deny]), rng.choice(principals),
+                 rng.choice(permissions + [ALL_PERMISSIONS, ('view', 'edit')]))
+                for i in range(rng.randint(0, 4))]
+    stock = ACLAuthorizationPolicy()
+    for trial in range(trials):
+        root = Resource('', acl=random_acl() if rng.random() < 0.8 else None)
+        store = EntryStore(root)
+        store.add_many((str(i), random_acl() if rng.random() < 0.7 else None)
+                       for i in range(size))
+        for permission in permissions:
+            held = rng.sample(principals, rng.randint(0, len(principals)))
+            expected = [str(i) for i in range(size)
+                        if stock.permits(store.resource(str(i)), held,
+                                         permission)]
+            got = []
+            after = None
+            while True:
+                page = store.entries(held, permission, limit=17, after=after)
+                if not page:
+                    break
+                got.extend(name for entry_id, name in page)
+                after = page[-1][0]
+            assert got == expected, (held, permission, got, expected)
+            assert store.count(held, permission) == len(expected)
+
+if __name__ == '__main__':
+    selfcheck(*[int(arg) for arg in sys.argv[1:]])
+    print('EntryStore agrees with ACLAuthorizationPolicy')
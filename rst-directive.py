@@ -27,6 +27,12 @@
 
     Look at the `directive documentation`_ to get all the gory details.
 
+    This copy caches each highlighted block in ``.pygments-cache``, keyed on
+    a hash of its source, lexer and formatter.  Blocks missing from the cache
+    are highlighted after the document is parsed, in a process pool when
+    there are several, and the output file is only rewritten when it
+    changed, so editing one slide re-highlights only that slide.
+
     .. _Docutils: http://docutils.sf.net/
     .. _directive documentation:
        http://docutils.sourceforge.net/docs/howto/rst-directives.html
@@ -52,13 +58,95 @@ VARIANTS = {
     # 'linenos': HtmlFormatter(noclasses=INLINESTYLES, linenos=True),
 }
 
+# Set to a file name (e.g. 'pygments.css') to have the stylesheet for the
+# formatters above written there, next to the output, once per build (unless
+# INLINESTYLES).  The ui/pretty theme imports its own, hand-tuned
+# ui/pretty/pygments.css from slides.css, so by default nothing is written.
+STYLESHEET = None
+
+
+import hashlib
+import os
+import re
+import sys
 
 from docutils import nodes
 from docutils.parsers.rst import directives, Directive
 
-from pygments import highlight
+from pygments import highlight, __version__ as pygments_version
 from pygments.lexers import get_lexer_by_name, TextLexer
 
+# Highlighted blocks are kept here, one file per block, named after a hash of
+# everything that goes into the HTML
+CACHE_DIR = '.pygments-cache'
+
+# Blocks that were not in the cache while the document was being parsed:
+# placeholder key -> (source, lexer name, variant name)
+PENDING = {}
+
+# Lexers resolved so far, by the name given to the directive; looking a name
+# up in the Pygments registry means scanning every lexer
+LEXERS = {}
+
+# The part of the cache key that describes each formatter
+FORMATTER_KEYS = {}
+
+def get_lexer(language):
+    try:
+        return LEXERS[language]
+    except KeyError:
+        try:
+            lexer = get_lexer_by_name(language)
+        except ValueError:
+            # no lexer found - use the text one instead of an exception
+            lexer = TextLexer()
+        LEXERS[language] = lexer
+        return lexer
+
+def get_formatter(variant):
+    return variant and VARIANTS[variant] or DEFAULT
+
+def formatter_key(variant):
+    try:
+        return FORMATTER_KEYS[variant]
+    except KeyError:
+        formatter = get_formatter(variant)
+        key = FORMATTER_KEYS[variant] = repr(
+            (variant, sorted(formatter.options.items()), STYLE, INLINESTYLES,
+             pygments_version))
+        return key
+
+def render(job):
+    source, language, variant = job
+    return highlight(source, get_lexer(language), get_formatter(variant))
+
+def cache_key(source, language, variant):
+    data = repr((source, language)) + formatter_key(variant)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, key + '.html')
+
+def read_cache(key):
+    try:
+        with open(cache_path(key), 'rb') as f:
+            return f.read().decode('utf-8')
+    except IOError:
+        return None
+
+def write_cache(key, html):
+    if not os.path.isdir(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    tmp = '%s.%d.tmp' % (cache_path(key), os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(html.encode('utf-8'))
+    os.rename(tmp, cache_path(key))
+
+PLACEHOLDER = re.compile(r'<!--pygments:([0-9a-f]{40})-->')
+
+def placeholder(key):
+    return '<!--pygments:%s-->' % key
+
 class Pygments(Directive):
     """ Source code syntax hightlighting.
     """
@@ -70,23 +158,102 @@ class Pygments(Directive):
 
     def run(self):
         self.assert_has_content()
-        try:
-            lexer = get_lexer_by_name(self.arguments[0])
-        except ValueError:
-            # no lexer found - use the text one instead of an exception
-            lexer = TextLexer()
         # take an arbitrary option if more than one is given
-        formatter = self.options and VARIANTS[self.options.keys()[0]] or DEFAULT
-
-        #print >>open('pygments.css', 'w'), formatter.get_style_defs('.highlight')
-        parsed = highlight(u'\n'.join(self.content), lexer, formatter)
+        variant = self.options and list(self.options)[0] or None
+        source = u'\n'.join(self.content)
+        language = self.arguments[0]
+        key = cache_key(source, language, variant)
+        parsed = read_cache(key)
+        if parsed is None:
+            # highlighted after parsing, with the other misses, in parallel
+            PENDING[key] = (source, language, variant)
+            parsed = placeholder(key)
         return [nodes.raw('', parsed, format='html')]
 
 directives.register_directive('sourcecode', Pygments)
 
-from docutils.core import publish_cmdline, default_description
+def render_pending():
+    """ Highlight the blocks that were not cached, using every core when
+    there is more than one, and cache them.  Return key -> HTML."""
+    keys = list(PENDING)
+    jobs = [PENDING[key] for key in keys]
+    # the pool pickles render() as a module and a name, which only works if
+    # that finds this very function (it does not when the file is run with
+    # runpy.run_path, say)
+    module = sys.modules.get(render.__module__)
+    if len(jobs) > 1 and getattr(module, 'render', None) is render:
+        import multiprocessing
+        pool = multiprocessing.Pool()
+        try:
+            results = pool.map(render, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [render(job) for job in jobs]
+    rendered = dict(zip(keys, results))
+    for key, html in rendered.items():
+        write_cache(key, html)
+    PENDING.clear()
+    return rendered
+
+def stylesheet():
+    """ The CSS for the default formatter and every variant."""
+    rules = []
+    for formatter in [DEFAULT] + list(VARIANTS.values()):
+        css = formatter.get_style_defs('.highlight')
+        if css not in rules:
+            rules.append(css)
+    return '\n'.join(rules) + '\n'
+
+def write_if_changed(filename, data):
+    try:
+        with open(filename, 'rb') as f:
+            if f.read() == data:
+                return False
+    except IOError:
+        pass
+    with open(filename, 'wb') as f:
+        f.write(data)
+    return True
+
+def main(argv=None):
+    from docutils.core import Publisher, default_description
+    from docutils.io import StringOutput
+
+    description = ('Generates S5 (X)HTML slideshow documents from standalone '
+                   'reStructuredText sources.  ' + default_description)
 
-description = ('Generates S5 (X)HTML slideshow documents from standalone '
-               'reStructuredText sources.  ' + default_description)
+    publisher = Publisher(destination_class=StringOutput)
+    publisher.set_components('standalone', 'restructuredtext', 's5')
+    output = publisher.publish(argv, description=description)
+    settings = publisher.settings
+    rendered = render_pending()
+    if rendered:
+        # put them all in, in one pass over the output
+        pattern = PLACEHOLDER
+        if isinstance(output, bytes):
+            pattern = re.compile(pattern.pattern.encode('ascii'))
+            rendered = dict(
+                (key.encode('ascii'),
+                 html.encode(settings.output_encoding,
+                             settings.output_encoding_error_handler))
+                for key, html in rendered.items())
+        output = pattern.sub(lambda match: rendered[match.group(1)], output)
+    if not isinstance(output, bytes):
+        output = output.encode(settings.output_encoding,
+                               settings.output_encoding_error_handler)
+    destination = settings._destination
+    if not destination or destination == '-':
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        out.write(output)
+        directory = ''
+    else:
+        write_if_changed(destination, output)
+        directory = os.path.dirname(destination)
+    if STYLESHEET and not INLINESTYLES:
+        write_if_changed(os.path.join(directory, STYLESHEET),
+                         stylesheet().encode('utf-8'))
 
-publish_cmdline(writer_name='s5', description=description)
+if __name__ == '__main__':
+    main()
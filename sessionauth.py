@@ -0,0 +1,206 @@
+"""
+A server-side session authentication policy with pluggable session stores.
+
+``DumbAuthenticationPolicy`` in app3.py and ``AuthTktAuthenticationPolicy``
+keep the whole identity in the cookie.  ``SessionStoreAuthenticationPolicy``
+keeps only a random session id in the cookie; the principal it stands for
+lives in a session store on the server, so ``forget`` really forgets::
+
+    store = SQLiteSessionStore('sessions.db')
+    authn_policy = SessionStoreAuthenticationPolicy(store)
+    config = Configurator(authentication_policy=authn_policy, ...)
+
+Two stores are provided.  ``MemorySessionStore`` keeps sessions in a
+dictionary, so they are private to one process.  ``SQLiteSessionStore``
+keeps them in an SQLite file that any number of processes can share.  It
+hands out connections from a small pool, deletes expired sessions in
+batches every ``sweep_interval`` seconds rather than on every request, and
+caches each session's principal for ``cache_ttl`` seconds.  A logout in one
+worker therefore takes effect in the others within ``cache_ttl`` seconds
+without every request having to query the database.
+
+A store is anything with ``create(principal, max_age)`` returning a new
+session id, ``get(session_id)`` returning the principal or ``None``, and
+``delete(session_id)``.
+"""
+import binascii
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from queue import Queue, Empty
+except ImportError: # Python 2
+    from Queue import Queue, Empty
+
+from pyramid.authentication import CallbackAuthenticationPolicy
+
+def new_session_id():
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+class MemorySessionStore(object):
+    """ Sessions in a dictionary, private to this process."""
+    def __init__(self, sweep_interval=60):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self.next_sweep = time.time() + sweep_interval
+
+    def create(self, principal, max_age):
+        session_id = new_session_id()
+        now = time.time()
+        with self.lock:
+            self.sessions[session_id] = (now + max_age, principal)
+            if now >= self.next_sweep:
+                self.next_sweep = now + self.sweep_interval
+                for key, (expires, _) in list(self.sessions.items()):
+                    if expires <= now:
+                        del self.sessions[key]
+        return session_id
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None and session[0] > time.time():
+            return session[1]
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+class SQLiteSessionStore(object):
+    """ Sessions in an SQLite file shared between processes."""
+    def __init__(self, filename, pool_size=4, sweep_interval=60,
+                 sweep_batch=1000, cache_ttl=1.0):
+        self.filename = filename
+        self.pool = Queue()
+        self.pool_size = pool_size
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.next_sweep = time.time() + sweep_interval
+        self.cache_ttl = cache_ttl
+        self.cache = {}
+        with self.connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                ' id TEXT PRIMARY KEY, principal TEXT, expires REAL)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS sessions_expires'
+                ' ON sessions (expires)')
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.pool.get_nowait()
+        except Empty:
+            with self.lock:
+                create = self.connections < self.pool_size
+                if create:
+                    self.connections += 1
+            if create:
+                conn = sqlite3.connect(self.filename, timeout=10,
+                                       isolation_level=None,
+                                       check_same_thread=False)
+            else:
+                conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    def create(self, principal, max_age):
+        session_id = new_session_id()
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute('INSERT INTO sessions VALUES (?, ?, ?)',
+                         (session_id, principal, now + max_age))
+        self.sweep(now)
+        return session_id
+
+    def get(self, session_id):
+        now = time.time()
+        # a worker that never sees a login still has to prune its cache
+        self.sweep(now)
+        cached = self.cache.get(session_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT principal, expires FROM sessions'
+                ' WHERE id = ? AND expires > ?', (session_id, now)).fetchone()
+        if row is None:
+            self.cache.pop(session_id, None)
+            return None
+        principal, expires = row
+        self.cache[session_id] = (
+            min(now + self.cache_ttl, expires), principal)
+        return principal
+
+    def delete(self, session_id):
+        self.cache.pop(session_id, None)
+        with self.connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def sweep(self, now=None):
+        """ Delete up to ``sweep_batch`` expired sessions, and drop the
+        expired entries of the cache, at most once every ``sweep_interval``
+        seconds per process."""
+        if now is None:
+            now = time.time()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        with self.connection() as conn:
+            conn.execute(
+                'DELETE FROM sessions WHERE id IN'
+                ' (SELECT id FROM sessions WHERE expires <= ? LIMIT ?)',
+                (now, self.sweep_batch))
+        for session_id, (expires, _) in list(self.cache.items()):
+            if expires <= now:
+                self.cache.pop(session_id, None)
+
+class SessionStoreAuthenticationPolicy(CallbackAuthenticationPolicy):
+    """ An authentication policy that keeps a session id in a cookie and
+    the principal in ``store``.  ``callback`` works as it does for
+    ``AuthTktAuthenticationPolicy``."""
+    def __init__(self, store, cookie_name='session', max_age=86400,
+                 callback=None, secure=False, debug=False):
+        self.store = store
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.callback = callback
+        self.secure = secure
+        self.debug = debug
+
+    def unauthenticated_userid(self, request):
+        session_id = request.cookies.get(self.cookie_name)
+        if session_id is not None:
+            return self.store.get(session_id)
+
+    def remember(self, request, principal, max_age=None):
+        """ Start a session for ``principal`` lasting ``max_age`` seconds
+        (the policy's ``max_age`` by default).  Like
+        ``AuthTktAuthenticationPolicy``, it raises ``TypeError`` for
+        keyword arguments it does not know."""
+        if max_age is None:
+            max_age = self.max_age
+        session_id = self.store.create(principal, max_age)
+        cookie = '%s=%s; Path=/; Max-Age=%d; HttpOnly' % (
+            self.cookie_name, session_id, max_age)
+        if self.secure:
+            cookie += '; Secure'
+        return [('Set-Cookie', cookie)]
+
+    def forget(self, request):
+        session_id = request.cookies.get(self.cookie_name)
+        if session_id is not None:
+            self.store.delete(session_id)
+        return [
+            ('Set-Cookie',
+             '%s=deleted; Path=/; Expires=Thu, 01-Jan-1970 00:00:01 GMT' %
+             self.cookie_name)
+            ]
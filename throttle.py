@@ -0,0 +1,122 @@
+"""
+Token-bucket rate limits for login attempts, per user and per client
+address.
+
+A login view that checks a password (see ``basicauth``) does expensive
+work for whoever asks, so a burst of attempts, or one client guessing
+passwords, ties up every waitress thread.  ``LoginThrottle`` gives each
+client address, and each userid tried from that address, a token bucket:
+``burst`` attempts at once, refilled at ``rate`` attempts per second.  An
+attempt only spends tokens when both buckets have one.  The userid bucket is
+per address so that someone spraying guesses at a userid cannot lock its
+owner out everywhere; guessing from many addresses is bounded by the
+address buckets.  The login view asks the throttle first and answers a
+throttled attempt with a response made in advance, before any password is
+looked at::
+
+    login_throttle = LoginThrottle()
+
+    @view_config(route_name='login')
+    def login(self):
+        request = self.request
+        userid = request.params.get('userid')
+        if not login_throttle.allow(userid, request.remote_addr):
+            return TOO_MANY_LOGINS
+        try:
+            verified = checker.verify(userid, request.params.get('password'),
+                                      block=False)
+        except CheckerBusy:
+            return TOO_MANY_LOGINS
+        ...
+
+With ``block=False`` a ``basicauth.PasswordChecker`` hashes the password
+in its process pool, and raises ``CheckerBusy`` at once instead of queueing
+when ``max_pending`` checks are already waiting for the pool.
+
+That is as far as this goes: a WSGI view has to return its response, so the
+request thread still waits for the hash it asked for.  What the pool buys is
+that the waiting threads do not hold the GIL the other requests need, and
+that at most ``max_pending`` threads wait at all; the rest of a storm gets a
+429 at once.  Nor does app7 check passwords (its ``login`` trusts the
+userid), so there it is only the throttle that runs.
+
+Each bucket is kept as a single float in a dictionary: the time at which
+it will be full again.  Taking a token pushes that time ``1 / rate``
+seconds later, and the bucket is empty when it is more than ``burst - 1``
+of those intervals away (the "generic cell rate algorithm" form of a token
+bucket).  A bucket whose time has passed is full, the same as having no
+bucket, so those are thrown away every ``sweep_interval`` seconds and
+memory only grows with the number of recently active users and
+addresses.
+"""
+import threading
+import time
+
+from constresponse import ConstantResponse
+
+TOO_MANY_LOGINS = ConstantResponse(
+    'Too many login attempts; try again later',
+    status='429 Too Many Requests', headers=[('Retry-After', '10')])
+
+class TokenBuckets(object):
+    """ A token bucket per key, each holding up to ``burst`` tokens and
+    refilled at ``rate`` tokens per second."""
+    def __init__(self, rate, burst, sweep_interval=60):
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.sweep_interval = sweep_interval
+        self.next_sweep = time.time() + sweep_interval
+        self.full_at = {}
+        self.lock = threading.Lock()
+
+    def ready(self, key, now):
+        """ Return whether ``take`` would succeed, without taking."""
+        full_at = max(self.full_at.get(key, now), now)
+        return full_at - now <= self.tolerance
+
+    def take(self, key, now=None):
+        """ Take a token from ``key``'s bucket; return False if it is
+        empty."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if now >= self.next_sweep:
+                self.sweep(now)
+            full_at = max(self.full_at.get(key, now), now)
+            if full_at - now > self.tolerance:
+                return False
+            self.full_at[key] = full_at + self.interval
+            return True
+
+    def sweep(self, now):
+        # called with the lock held
+        self.next_sweep = now + self.sweep_interval
+        self.full_at = dict((key, full_at) for key, full_at
+                            in self.full_at.items() if full_at > now)
+
+    def __len__(self):
+        return len(self.full_at)
+
+class LoginThrottle(object):
+    """ Limit login attempts per userid and client address (by default a
+    burst of 5, then one every 10 seconds) and per client address (a burst
+    of 20, then one a second)."""
+    def __init__(self, user_rate=0.1, user_burst=5, address_rate=1.0,
+                 address_burst=20):
+        self.users = TokenBuckets(user_rate, user_burst)
+        self.addresses = TokenBuckets(address_rate, address_burst)
+        self.lock = threading.Lock()
+
+    def allow(self, userid, address):
+        now = time.time()
+        user = None if userid is None else (userid, address)
+        with self.lock:
+            # spend from neither unless both have a token
+            if not self.addresses.ready(address, now):
+                return False
+            if user is not None and not self.users.ready(user, now):
+                return False
+            self.addresses.take(address, now)
+            if user is not None:
+                self.users.take(user, now)
+            return True
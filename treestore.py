@@ -0,0 +1,244 @@
+"""
+A compact, memory-mapped on-disk format for resource trees.
+
+``dump(root, filename)`` writes a tree of app7-style ``Resource`` objects
+(anything with ``__name__``, ``children`` and an optional ``__acl__``) to a
+file.  ``open_tree(filename)`` maps the file read-only and returns a root
+node that supports the same ``__getitem__``/``__name__``/``__parent__``/
+``__acl__`` protocol that traversal and ``ACLAuthorizationPolicy`` use::
+
+    root = treestore.open_tree('blog.tree')
+
+    def root_factory(request):
+        return root
+
+Opening the file does not read it; nodes are decoded lazily as traversal
+touches them.  Because the file is mapped read-only, processes that open the
+same file share its pages.
+
+The file is laid out as:
+
+- a header (``HEADER``),
+- one fixed-size ``NODE`` record per node, numbered breadth first so that the
+  children of a node are contiguous and sorted by (UTF-8 encoded) name,
+- one ``ACLREF`` record per distinct ACL,
+- the node names, concatenated,
+- the distinct ACLs, each encoded as JSON.
+"""
+import json
+import mmap
+import os
+import struct
+from collections import deque
+
+from pyramid.compat import is_nonstr_iter
+from pyramid.security import ALL_PERMISSIONS
+
+MAGIC = b'BIKETREE'
+VERSION = 1
+# magic, version, node count, acl count, then the offsets of the node
+# table, the acl table, the names blob and the acls blob
+HEADER = struct.Struct('<8sIIIQQQQ')
+# parent, name offset, name length, first child, child count, acl index
+NODE = struct.Struct('<iIIIIi')
+# acl offset, acl length
+ACLREF = struct.Struct('<II')
+
+_ALL = '__ALL_PERMISSIONS__'
+
+def _encode_acl(acl):
+    aces = []
+    for action, principal, permission in acl:
+        if permission is ALL_PERMISSIONS:
+            permission = _ALL
+        elif is_nonstr_iter(permission):
+            permission = list(permission)
+        aces.append([action, principal, permission])
+    return json.dumps(aces, separators=(',', ':')).encode('utf-8')
+
+def _decode_acl(data):
+    acl = []
+    for action, principal, permission in json.loads(data.decode('utf-8')):
+        if permission == _ALL:
+            permission = ALL_PERMISSIONS
+        elif isinstance(permission, list):
+            permission = tuple(permission)
+        acl.append((action, principal, permission))
+    return tuple(acl)
+
+def _encode_name(name):
+    if isinstance(name, bytes):
+        return name
+    return name.encode('utf-8')
+
+def dump(root, filename):
+    """ Write the tree rooted at ``root`` to ``filename``.  The file is
+    written next to its final location and renamed into place, so readers
+    that already have it open keep seeing the old tree."""
+    records = []
+    names = []
+    names_size = 0
+    acls = {}
+    acl_blobs = []
+    encoded = {}
+    queue = deque([(root, -1)])
+    while queue:
+        node, parent = queue.popleft()
+        index = len(records)
+        name = _encode_name(node.__name__)
+        acl_index = -1
+        acl = getattr(node, '__acl__', None)
+        if acl is not None:
+            try:
+                blob = encoded.get(acl)
+            except TypeError: # unhashable
+                blob = None
+            if blob is None:
+                blob = _encode_acl(acl)
+                try:
+                    encoded[acl] = blob
+                except TypeError:
+                    pass
+            acl_index = acls.get(blob)
+            if acl_index is None:
+                acl_index = acls[blob] = len(acl_blobs)
+                acl_blobs.append(blob)
+        children = sorted(node.children.values(),
+                          key=lambda child: _encode_name(child.__name__))
+        first_child = index + len(queue) + 1
+        records.append([parent, names_size, len(name), first_child,
+                        len(children), acl_index])
+        names.append(name)
+        names_size += len(name)
+        for child in children:
+            queue.append((child, index))
+
+    nodes_offset = HEADER.size
+    acls_offset = nodes_offset + NODE.size * len(records)
+    names_offset = acls_offset + ACLREF.size * len(acl_blobs)
+    blobs_offset = names_offset + names_size
+
+    tmpname = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmpname, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(acl_blobs),
+                            nodes_offset, acls_offset, names_offset,
+                            blobs_offset))
+        for record in records:
+            f.write(NODE.pack(*record))
+        offset = 0
+        for blob in acl_blobs:
+            f.write(ACLREF.pack(offset, len(blob)))
+            offset += len(blob)
+        f.write(b''.join(names))
+        f.write(b''.join(acl_blobs))
+    os.rename(tmpname, filename)
+
+class TreeStore(object):
+    """ An open tree file.  Use ``open_tree`` rather than creating one of
+    these directly."""
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.node_count, self.acl_count, self.nodes_offset,
+         self.acls_offset, self.names_offset, self.blobs_offset,
+         ) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d tree file' % (
+                filename, VERSION))
+        self.acls = {}
+
+    def record(self, index):
+        return NODE.unpack_from(
+            self.map, self.nodes_offset + NODE.size * index)
+
+    def name(self, index):
+        _, offset, length, _, _, _ = self.record(index)
+        start = self.names_offset + offset
+        return self.map[start:start + length]
+
+    def acl(self, acl_index):
+        acl = self.acls.get(acl_index)
+        if acl is None:
+            offset, length = ACLREF.unpack_from(
+                self.map, self.acls_offset + ACLREF.size * acl_index)
+            start = self.blobs_offset + offset
+            acl = self.acls[acl_index] = _decode_acl(
+                self.map[start:start + length])
+        return acl
+
+    def find_child(self, index, name):
+        """ Return the index of the child of node ``index`` named ``name``
+        or ``None``, by binary search over its (sorted) children."""
+        _, _, _, lo, count, _ = self.record(index)
+        name = _encode_name(name)
+        hi = lo + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_name = self.name(mid)
+            if mid_name < name:
+                lo = mid + 1
+            elif mid_name > name:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def close(self):
+        self.map.close()
+
+class StoredResource(object):
+    """ A lazily decoded node of a ``TreeStore``."""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def __name__(self):
+        return self.store.name(self.index).decode('utf-8')
+
+    @property
+    def __parent__(self):
+        parent = self.store.record(self.index)[0]
+        if parent < 0:
+            return None
+        return StoredResource(self.store, parent)
+
+    @property
+    def __acl__(self):
+        acl_index = self.store.record(self.index)[5]
+        if acl_index < 0:
+            raise AttributeError('__acl__')
+        return self.store.acl(acl_index)
+
+    @property
+    def children(self):
+        _, _, _, first, count, _ = self.store.record(self.index)
+        store = self.store
+        return dict((store.name(i).decode('utf-8'), StoredResource(store, i))
+                    for i in range(first, first + count))
+
+    def __getitem__(self, name):
+        index = self.store.find_child(self.index, name)
+        if index is None:
+            raise KeyError(name)
+        return StoredResource(self.store, index)
+
+    def __eq__(self, other):
+        return (isinstance(other, StoredResource) and
+                other.store is self.store and other.index == self.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __repr__(self):
+        return '<StoredResource named %r at index %d>' % (
+            self.__name__, self.index)
+
+def open_tree(filename):
+    """ Map ``filename`` and return the root of the tree stored in it."""
+    return StoredResource(TreeStore(filename), 0)